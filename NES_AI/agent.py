@@ -9,37 +9,186 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
-from config import ACTIONS
+from config import ACTIONS, OBSERVATION_MODE, BACKBONE, DUELING
 
-class DQN(nn.Module):
-    def __init__(self, input_shape, n_actions):
+# Backbone registry: name -> (observation modes, builder(input_shape) -> list of layers).
+# A backbone maps an observation to a flat feature vector; QNetwork puts a Q head on top.
+BACKBONES = {}
+
+def register_backbone(name, modes):
+    def decorator(builder):
+        BACKBONES[name] = (modes, builder)
+        return builder
+    return decorator
+
+def _separable(in_channels, out_channels, kernel, stride):
+    """Depthwise conv (one filter per channel) followed by a 1x1 pointwise conv."""
+    return [nn.Conv2d(in_channels, in_channels, kernel, stride=stride, groups=in_channels),
+            nn.Conv2d(in_channels, out_channels, 1),
+            nn.ReLU()]
+
+@register_backbone("nature", ("screen",))
+def nature_backbone(input_shape):
+    """Nature DQN stack (3 convs, 3136x512 FC)."""
+    return [nn.Conv2d(input_shape[0], 32, 8, stride=4), nn.ReLU(),
+            nn.Conv2d(32, 64, 4, stride=2), nn.ReLU(),
+            nn.Conv2d(64, 64, 3, stride=1), nn.ReLU(),
+            nn.Flatten(), nn.Linear(64 * 7 * 7, 512), nn.ReLU()]
+
+@register_backbone("small", ("screen",))
+def small_backbone(input_shape):
+    """2013 DQN stack: 2 narrow convs and a 256-unit FC, about a third of nature's weights."""
+    return [nn.Conv2d(input_shape[0], 16, 8, stride=4), nn.ReLU(),
+            nn.Conv2d(16, 32, 4, stride=2), nn.ReLU(),
+            nn.Flatten(), nn.Linear(32 * 9 * 9, 256), nn.ReLU()]
+
+@register_backbone("wide", ("screen",))
+def wide_backbone(input_shape):
+    """Nature layout with twice the channels."""
+    return [nn.Conv2d(input_shape[0], 64, 8, stride=4), nn.ReLU(),
+            nn.Conv2d(64, 128, 4, stride=2), nn.ReLU(),
+            nn.Conv2d(128, 128, 3, stride=1), nn.ReLU(),
+            nn.Flatten(), nn.Linear(128 * 7 * 7, 512), nn.ReLU()]
+
+@register_backbone("separable", ("screen",))
+def separable_backbone(input_shape):
+    """Nature layout with depthwise-separable convs after the first layer and a 256-unit FC."""
+    return [nn.Conv2d(input_shape[0], 32, 8, stride=4), nn.ReLU(),
+            *_separable(32, 64, 4, 2),
+            *_separable(64, 64, 3, 1),
+            nn.Flatten(), nn.Linear(64 * 7 * 7, 256), nn.ReLU()]
+
+@register_backbone("mlp", ("ram",))
+def mlp_backbone(input_shape):
+    """Two 256-unit layers for the compact RAM observation vector."""
+    return [nn.Linear(input_shape[0], 256), nn.ReLU(),
+            nn.Linear(256, 256), nn.ReLU()]
+
+@register_backbone("mlp_small", ("ram",))
+def mlp_small_backbone(input_shape):
+    return [nn.Linear(input_shape[0], 128), nn.ReLU(),
+            nn.Linear(128, 128), nn.ReLU()]
+
+def observation_shape(observation_mode):
+    """Network input shape (without the batch dim) for an observation mode."""
+    if observation_mode == "ram":
+        from ram_observation import RAM_OBS_SIZE
+        return (RAM_OBS_SIZE,)
+    return (1, 84, 84)
+
+def default_backbone(observation_mode):
+    return "mlp" if observation_mode == "ram" else "nature"
+
+class QNetwork(nn.Module):
+    """
+    Backbone layers followed by a Q head.
+
+    The plain head is the last layer of self.model, so the nature and mlp
+    backbones keep the parameter names of checkpoints saved before the registry.
+    The dueling head splits into a state value and per-action advantages.
+    """
+
+    def __init__(self, layers, input_shape, n_actions, dueling=False):
         super().__init__()
-        self.model = nn.Sequential(
-            nn.Conv2d(1, 32, 8, stride=4),
-            nn.ReLU(),
-            nn.Conv2d(32, 64, 4, stride=2),
-            nn.ReLU(),
-            nn.Conv2d(64, 64, 3, stride=1),
-            nn.ReLU(),
-            nn.Flatten(),
-            nn.Linear(64 * 7 * 7, 512),
-            nn.ReLU(),
-            nn.Linear(512, n_actions)
-        )
+        with torch.no_grad():
+            features = nn.Sequential(*layers)(torch.zeros(1, *input_shape)).shape[1]
+        self.dueling = dueling
+        if dueling:
+            self.model = nn.Sequential(*layers)
+            self.value = nn.Linear(features, 1)
+            self.advantage = nn.Linear(features, n_actions)
+        else:
+            self.model = nn.Sequential(*layers, nn.Linear(features, n_actions))
 
     def forward(self, x):
-        return self.model(x)
+        if not self.dueling:
+            return self.model(x)
+        features = self.model(x)
+        advantage = self.advantage(features)
+        return self.value(features) + advantage - advantage.mean(dim=1, keepdim=True)
+
+def build_network(observation_mode, n_actions, backbone=None, dueling=False):
+    backbone = backbone or default_backbone(observation_mode)
+    if backbone not in BACKBONES:
+        raise ValueError(f"unknown backbone '{backbone}' (available: {', '.join(BACKBONES)})")
+    modes, builder = BACKBONES[backbone]
+    if observation_mode not in modes:
+        raise ValueError(f"backbone '{backbone}' does not support '{observation_mode}' observations")
+    input_shape = observation_shape(observation_mode)
+    return QNetwork(builder(input_shape), input_shape, n_actions, dueling)
+
+def profile_backbones(observation_mode=OBSERVATION_MODE, batch_size=32, repeats=30, names=None):
+    """
+    Measure every backbone that supports observation_mode, with and without the dueling head.
+
+    Returns:
+        list of dicts: backbone, dueling, params, act_ms (forward of one observation,
+        as an actor decides), forward_ms and train_ms (forward + backward + Adam step)
+        at batch_size
+    """
+    import time
+
+    shape = observation_shape(observation_mode)
+    single = torch.rand(1, *shape)
+    batch = torch.rand(batch_size, *shape)
+    actions = torch.randint(0, len(ACTIONS), (batch_size, 1))
+    targets = torch.rand(batch_size, 1)
+
+    def timed(fn):
+        fn()  # Warm up allocations
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - start) / repeats * 1000
+
+    results = []
+    for name in names or BACKBONES:
+        if observation_mode not in BACKBONES[name][0]:
+            continue
+        for dueling in (False, True):
+            net = build_network(observation_mode, len(ACTIONS), name, dueling)
+            optimizer = optim.Adam(net.parameters(), lr=1e-4)
+
+            def act():
+                with torch.inference_mode():
+                    net(single)
+
+            def forward():
+                with torch.inference_mode():
+                    net(batch)
+
+            def train():
+                loss = nn.functional.mse_loss(net(batch).gather(1, actions), targets)
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            results.append({
+                "backbone": name,
+                "dueling": dueling,
+                "params": sum(p.numel() for p in net.parameters()),
+                "act_ms": timed(act),
+                "forward_ms": timed(forward),
+                "train_ms": timed(train),
+            })
+    return results
 
 class Agent:
-    def __init__(self):
+    def __init__(self, observation_mode=OBSERVATION_MODE, lr=1e-4, gamma=0.99,
+                 epsilon_decay=0.999993, epsilon_min=0.05, backbone=BACKBONE, dueling=DUELING):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = DQN((1, 84, 84), len(ACTIONS)).to(self.device)
-        self.target = DQN((1, 84, 84), len(ACTIONS)).to(self.device)
-        self.optimizer = optim.Adam(self.model.parameters(), lr=1e-4)
-        self.gamma = 0.99
+        self.observation_mode = observation_mode
+        # Screen frames are (84, 84) and need a channel dim; RAM vectors are already flat
+        self.add_channel = observation_mode != "ram"
+        self.backbone = backbone or default_backbone(observation_mode)
+        self.dueling = dueling
+        self.model = build_network(observation_mode, len(ACTIONS), self.backbone, dueling).to(self.device)
+        self.target = build_network(observation_mode, len(ACTIONS), self.backbone, dueling).to(self.device)
+        self.optimizer = optim.Adam(self.model.parameters(), lr=lr)
+        self.gamma = gamma
         self.epsilon = 1.0
-        self.epsilon_decay = 0.999993  # Proper decay for 1500 episodes (~450k steps)
-        self.epsilon_min = 0.05
+        self.epsilon_decay = epsilon_decay  # Default is a proper decay for 1500 episodes (~450k steps)
+        self.epsilon_min = epsilon_min
 
     def select_action(self, state, available_actions):
         # Map available action strings to their indices in the full ACTIONS list
@@ -49,7 +198,7 @@ class Agent:
         if np.random.rand() < self.epsilon:
             return int(np.random.choice(indices))
 
-        state = torch.tensor(state, dtype=torch.float32).unsqueeze(0).unsqueeze(0).to(self.device)
+        state = self._to_batch(np.asarray(state)[None])
         q_values = self.model(state)
 
         # Map full Q-values to available_actions only and return full index
@@ -58,28 +207,75 @@ class Agent:
         best_rel = int(np.argmax(filtered_q_values))
         return int(indices[best_rel])
 
+    def greedy_actions(self, states, indices):
+        """Greedy full action index for each state in a batch, restricted to indices (no autograd)."""
+        with torch.inference_mode():
+            q_values = self.model(self._to_batch(np.asarray(states)))
+        filtered_q_values = q_values.cpu().numpy()[:, indices]
+        return [int(indices[i]) for i in filtered_q_values.argmax(axis=1)]
+
+    def _to_batch(self, states):
+        states = torch.tensor(states, dtype=torch.float32)
+        if self.add_channel:
+            states = states.unsqueeze(1)
+        return states.to(self.device)
+
     def train_step(self, buffer, batch_size=32):
         if len(buffer) < batch_size:
             return
 
-        states, actions, rewards, next_states, dones = buffer.sample(batch_size)
-        states = torch.tensor(states, dtype=torch.float32).unsqueeze(1).to(self.device)
-        next_states = torch.tensor(next_states, dtype=torch.float32).unsqueeze(1).to(self.device)
+        self.learn(*buffer.sample(batch_size))
+        self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
+
+    def learn(self, states, actions, rewards, next_states, dones, discounts=None):
+        """
+        One TD update from a batch of transitions (any source). Returns the detached loss.
+
+        discounts: optional per-transition bootstrap discount (gamma^n for n-step
+        returns, NaN or None for one-step transitions, which use self.gamma)
+        """
+        states = self._to_batch(states)
+        next_states = self._to_batch(next_states)
         actions = torch.tensor(actions, dtype=torch.int64).unsqueeze(1).to(self.device)
         rewards = torch.tensor(rewards, dtype=torch.float32).unsqueeze(1).to(self.device)
         dones = torch.tensor(dones, dtype=torch.float32).unsqueeze(1).to(self.device)
 
         q_values = self.model(states).gather(1, actions)
+        if discounts is None:
+            discounts = torch.full_like(rewards, self.gamma)
+        else:
+            discounts = torch.tensor(discounts, dtype=torch.float32).unsqueeze(1).to(self.device)
+            discounts = torch.nan_to_num(discounts, nan=self.gamma)
+
         with torch.no_grad():
             target_q = self.target(next_states).max(1)[0].unsqueeze(1)
-            target = rewards + (1 - dones) * self.gamma * target_q
+            target = rewards + (1 - dones) * discounts * target_q
 
         loss = nn.functional.mse_loss(q_values, target)
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
+        return loss.detach()
 
-        self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
+    def imitate(self, states, actions):
+        """One behavior cloning update: treat Q-values as logits of the demonstrated action."""
+        states = self._to_batch(states)
+        actions = torch.tensor(actions, dtype=torch.int64).to(self.device)
+
+        loss = nn.functional.cross_entropy(self.model(states), actions)
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        return loss.detach()
+
+    def memory_bytes(self):
+        """Live bytes of both networks (weights, gradients, buffers) and the optimizer state."""
+        tensors = list(self.model.parameters()) + list(self.target.parameters())
+        tensors += [p.grad for p in tensors if p.grad is not None]
+        tensors += list(self.model.buffers()) + list(self.target.buffers())
+        for state in self.optimizer.state.values():
+            tensors += [v for v in state.values() if torch.is_tensor(v)]
+        return sum(t.element_size() * t.nelement() for t in tensors)
 
     def update_target(self):
         self.target.load_state_dict(self.model.state_dict())
@@ -88,16 +284,51 @@ class Agent:
         os.makedirs(os.path.dirname(path), exist_ok=True)
         checkpoint = {
             'model_state_dict': self.model.state_dict(),
-            'epsilon': self.epsilon
+            'epsilon': self.epsilon,
+            'observation_mode': self.observation_mode,
+            'backbone': self.backbone,
+            'dueling': self.dueling
         }
         torch.save(checkpoint, path)
         print(f"✅ Model saved to {path} (epsilon: {self.epsilon:.3f})")
 
+    def checkpoint_path(self, path="models/dqn_model.pth"):
+        """path tagged with this agent's network (mode, backbone, head), for when path holds another network."""
+        root, ext = os.path.splitext(path)
+        head = "_dueling" if self.dueling else ""
+        return f"{root}_{self.observation_mode}_{self.backbone}{head}{ext}"
+
+    def resume(self, path="models/dqn_model.pth"):
+        """
+        Load path, or this agent's own checkpoint_path if path is for another network.
+
+        Returns the path to save to; never a checkpoint this agent could not load,
+        so a mismatched checkpoint is kept instead of overwritten.
+        """
+        if self.load_model(path) or not os.path.exists(path):
+            return path
+        own = self.checkpoint_path(path)
+        print(f"💾 Keeping {path} - this run resumes from and saves to {own}")
+        self.load_model(own)
+        return own
+
     def load_model(self, path="models/dqn_model.pth"):
+        """Load weights from path if they fit this agent's network. Returns True if they were loaded."""
         if os.path.exists(path):
             checkpoint = torch.load(path, map_location=self.device)
             # Handle both old format (just state_dict) and new format (checkpoint dict)
             if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
+                saved_mode = checkpoint.get('observation_mode', 'screen')
+                if saved_mode != self.observation_mode:
+                    print(f"⚠️ Checkpoint at {path} is for '{saved_mode}' observations, "
+                          f"agent uses '{self.observation_mode}' - starting fresh.")
+                    return False
+                # Checkpoints from before the backbone registry used the default networks
+                saved_net = (checkpoint.get('backbone', default_backbone(saved_mode)), checkpoint.get('dueling', False))
+                if saved_net != (self.backbone, self.dueling):
+                    print(f"⚠️ Checkpoint at {path} is for backbone '{saved_net[0]}' (dueling: {saved_net[1]}), "
+                          f"agent uses '{self.backbone}' (dueling: {self.dueling}) - starting fresh.")
+                    return False
                 self.model.load_state_dict(checkpoint['model_state_dict'])
                 self.epsilon = checkpoint.get('epsilon', 1.0)
                 print(f"📦 Loaded model from {path} (epsilon: {self.epsilon:.3f})")
@@ -106,5 +337,58 @@ class Agent:
                 self.model.load_state_dict(checkpoint)
                 print(f"📦 Loaded model from {path} (old format, epsilon reset to 1.0)")
             self.update_target()
+            return True
+        print(f"⚠️ No model found at {path}, starting fresh.")
+        return False
+
+
+def load_agent(path="models/dqn_model.pth", **kwargs):
+    """
+    Agent built for the network stored in a checkpoint, with its weights loaded.
+
+    Observation mode, backbone and dueling head come from the checkpoint (old
+    weight-only checkpoints are screen-mode default networks); kwargs go to Agent.
+    Raises FileNotFoundError or ValueError if no weights could be loaded.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"no checkpoint at {path}")
+    checkpoint = torch.load(path, map_location="cpu")
+    config = checkpoint if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint else {}
+    mode = config.get('observation_mode', 'screen')
+    agent = Agent(mode, backbone=config.get('backbone', default_backbone(mode)),
+                  dueling=config.get('dueling', False), **kwargs)
+    try:
+        loaded = agent.load_model(path)
+    except RuntimeError as e:
+        raise ValueError(f"checkpoint at {path} does not fit its network: {e}") from e
+    if not loaded:
+        raise ValueError(f"checkpoint at {path} could not be loaded")
+    return agent
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parameter count and latency of each network backbone")
+    parser.add_argument("--mode", choices=("screen", "ram"), default=OBSERVATION_MODE)
+    parser.add_argument("--batch-size", type=int, default=32, help="learner batch size (train_step uses 32)")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads, i.e. cores per actor or learner")
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--act-budget-ms", type=float, help="per-decision actor budget; recommends the largest network within it")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    print(f"⏱️ {args.mode} observations, batch {args.batch_size}, {args.threads} thread(s)")
+    print(f"{'backbone':12s} {'dueling':>7s} {'params':>10s} {'act ms':>8s} {'fwd ms':>8s} {'train ms':>9s}")
+    results = profile_backbones(args.mode, args.batch_size, args.repeats)
+    for r in results:
+        print(f"{r['backbone']:12s} {str(r['dueling']):>7s} {r['params']:10,d} {r['act_ms']:8.3f} "
+              f"{r['forward_ms']:8.3f} {r['train_ms']:9.3f}")
+    if args.act_budget_ms:
+        fitting = [r for r in results if r['act_ms'] <= args.act_budget_ms]
+        if fitting:
+            best = max(fitting, key=lambda r: r['params'])
+            print(f"✅ Largest network within {args.act_budget_ms} ms per decision: "
+                  f"BACKBONE = \"{best['backbone']}\", DUELING = {best['dueling']}")
         else:
-            print(f"⚠️ No model found at {path}, starting fresh.")
+            print(f"❌ No backbone decides within {args.act_budget_ms} ms")
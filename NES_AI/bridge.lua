@@ -1,3 +1,26 @@
+-- Export the compact RAM observation (tile grid, enemy slots, Mario velocity).
+-- Set to true when OBSERVATION_MODE = "ram" in config.py.
+local EXPORT_RAM_OBS = false
+
+-- Output settings
+-- "json":   rewrite mario_memory.json with the full state on every publish
+-- "stream": append only the changed fields to mario_memory.stream, with a full
+--           keyframe every STREAM_KEYFRAME_INTERVAL publishes (the file is truncated
+--           at each keyframe so it never grows without bound).
+-- Must match MEMORY_FORMAT in config.py.
+local OUTPUT_MODE = "json"
+local PUBLISH_INTERVAL = 1          -- Read and publish state every N frames (commands are polled at the same cadence)
+local STREAM_KEYFRAME_INTERVAL = 300
+local VERIFY_LOG = false            -- Also append every full state to mario_memory.full.jsonl (for bridge_check.py)
+
+-- Debug outputs (each costs file or console I/O on every publish)
+local DEBUG_LOG = true              -- memory_debug.log
+local SCORE_LOG = true              -- score_changes.log
+local CONSOLE_PRINT = true          -- Lua console
+
+-- Only rescan tiles written since the last publish (needs memory.registerwrite)
+local DIRTY_BLOCK_SCAN = true
+
 -- Minimal JSON encoder
 local function escape_str(s)
     return s:gsub("\\", "\\\\"):gsub('"', '\\"')
@@ -14,6 +37,9 @@ local function encode_json(tbl)
             value = tostring(v)
         elseif type(v) == "string" then
             value = '"' .. escape_str(v) .. '"'
+        elseif type(v) == "table" then
+            -- Flat numeric arrays only (RAM observation)
+            value = "[" .. table.concat(v, ",") .. "]"
         else
             value = "null"
         end
@@ -28,23 +54,49 @@ local function encode_json(tbl)
 end
 
 -- Track Q Block hits
+local BLOCK_SCAN_START = 0x0500
+local BLOCK_SCAN_SIZE = 14 * 16
 local prev_block_states = {}
 local function is_q_block(tile)
     return tile == 0x24
 end
 
+-- Dirty-region tracking: the write hook records which tile bytes changed, so
+-- check_q_block_hit only has to compare those. A full scan is still needed to
+-- seed prev_block_states and after a savestate load (which bypasses the hook).
+local dirty_tiles = {}
+local needs_full_scan = true
+local use_dirty_scan = DIRTY_BLOCK_SCAN and memory.registerwrite ~= nil
+if use_dirty_scan then
+    memory.registerwrite(BLOCK_SCAN_START, BLOCK_SCAN_SIZE, function(addr)
+        dirty_tiles[addr] = true
+    end)
+end
+
+local function check_tile(addr)
+    local tile = memory.readbyte(addr)
+    local hit = is_q_block(tile) and prev_block_states[addr] ~= nil and prev_block_states[addr] ~= tile
+    prev_block_states[addr] = tile
+    return hit
+end
+
 local function check_q_block_hit()
     local hit = false
-    for y = 0, 13 do
-        for x = 0, 15 do
-            local addr = 0x0500 + y * 16 + x
-            local tile = memory.readbyte(addr)
-            if is_q_block(tile) and prev_block_states[addr] and prev_block_states[addr] ~= tile then
+    if use_dirty_scan and not needs_full_scan then
+        for addr in pairs(dirty_tiles) do
+            if check_tile(addr) then
                 hit = true
             end
-            prev_block_states[addr] = tile
         end
+    else
+        for addr = BLOCK_SCAN_START, BLOCK_SCAN_START + BLOCK_SCAN_SIZE - 1 do
+            if check_tile(addr) then
+                hit = true
+            end
+        end
+        needs_full_scan = false
     end
+    dirty_tiles = {}
     return hit
 end
 
@@ -58,6 +110,61 @@ local function check_powerup_spawned()
     return false
 end
 
+-- RAM observation export
+-- Tile buffer at 0x0500 holds two 16x13 metatile pages (0xD0 bytes each) that
+-- together form a 32-column ring following the scroll position.
+local OBS_ROWS = 13
+local OBS_COLS = 16
+local OBS_COLS_BEHIND = 2
+local ENEMY_SLOTS = 5
+
+local function signed_byte(v)
+    if v >= 0x80 then
+        return v - 0x100
+    end
+    return v
+end
+
+local function read_tile_grid(mario_x)
+    local grid = {}
+    local mario_col = math.floor(mario_x / 16)
+    for row = 0, OBS_ROWS - 1 do
+        for c = 0, OBS_COLS - 1 do
+            local col = (mario_col - OBS_COLS_BEHIND + c) % 32
+            local page = math.floor(col / 16)
+            local tile = memory.readbyte(0x0500 + page * 0xD0 + row * 16 + (col % 16))
+            -- 0 = empty, 1 = solid, 2 = question block
+            if tile == 0 then
+                grid[#grid + 1] = 0
+            elseif is_q_block(tile) then
+                grid[#grid + 1] = 2
+            else
+                grid[#grid + 1] = 1
+            end
+        end
+    end
+    return grid
+end
+
+local function read_enemy_slots(mario_x)
+    -- Per slot: active flag, X offset from Mario, Y position
+    local slots = {}
+    for i = 0, ENEMY_SLOTS - 1 do
+        local active = memory.readbyte(0x000F + i) ~= 0
+        if active then
+            local ex = memory.readbyte(0x006E + i) * 0x100 + memory.readbyte(0x0087 + i)
+            slots[#slots + 1] = 1
+            slots[#slots + 1] = ex - mario_x
+            slots[#slots + 1] = memory.readbyte(0x00CF + i)
+        else
+            slots[#slots + 1] = 0
+            slots[#slots + 1] = 0
+            slots[#slots + 1] = 0
+        end
+    end
+    return slots
+end
+
 -- ⏺️ Track previous lives for detecting life lost
 local previous_lives = nil
 
@@ -65,10 +172,68 @@ local previous_lives = nil
 local previous_score = 0
 local score_reset_detected = false
 
+-- Command channel (see bridge_commands.py)
+-- One line "<id> <command> <arg>" written atomically by Python; each id runs once.
+local COMMAND_FILE = "bridge_command.txt"
+local last_command_id = 0
+local command_ack = { id = 0, ok = false, frame = 0 }
+
+local function run_command(command, slot)
+    if command == "load_state" then
+        savestate.load(savestate.object(slot))
+        -- Frame-to-frame trackers must not compare across the jump
+        previous_lives = nil
+        previous_score = 0
+        prev_block_states = {}
+        needs_full_scan = true
+    elseif command == "save_state" then
+        local state = savestate.object(slot)
+        savestate.save(state)
+        savestate.persist(state)
+    else
+        error("unknown command " .. command)
+    end
+end
+
+local function read_command()
+    local f = io.open(COMMAND_FILE, "r")
+    if not f then
+        return nil
+    end
+    local line = f:read("*l")
+    f:close()
+    if not line then
+        return nil
+    end
+    local id, command, arg = line:match("^(%d+)%s+(%S+)%s*(%d*)")
+    return tonumber(id), command, arg
+end
+
+-- A command file left over from an earlier session must not run when the script starts
+last_command_id = read_command() or 0
+
+local function poll_commands()
+    local id, command, arg = read_command()
+    if not id or id <= last_command_id then
+        return
+    end
+    last_command_id = id
+
+    local ok, err = pcall(run_command, command, tonumber(arg) or 1)
+    if not ok then
+        print("[CMD] " .. tostring(err))
+    end
+    command_ack = { id = id, ok = ok, frame = emu.framecount() }
+end
+
 -- Main memory reader
 local function read_game_state()
     local state = {}
     state["timestamp"] = os.time()
+    state["frame"] = emu.framecount()
+    state["cmd_ack"] = command_ack.id
+    state["cmd_ok"] = command_ack.ok
+    state["cmd_frame"] = command_ack.frame
 
     local mode = memory.readbyte(0x0770)
     local mario_state = memory.readbyte(0x000E)
@@ -168,6 +333,13 @@ local function read_game_state()
     state["q_block_hit"] = check_q_block_hit()
     state["q_block_powerup"] = check_powerup_spawned()
 
+    if EXPORT_RAM_OBS then
+        state["ram_tiles"] = read_tile_grid(x_pos)
+        state["ram_enemies"] = read_enemy_slots(x_pos)
+        state["mario_vx"] = signed_byte(memory.readbyte(0x0057))
+        state["mario_vy"] = signed_byte(memory.readbyte(0x009F))
+    end
+
     -- Debug fields
     state["_mode"] = mode
     state["_mario_state"] = mario_state
@@ -186,9 +358,73 @@ local function write_to_json(state)
     end
 end
 
--- Debug log to file with score tracking
+-- Change-only stream output (decoded by bridge_stream.py)
+local STREAM_FILE = "mario_memory.stream"
+local VERIFY_FILE = "mario_memory.full.jsonl"
+local stream_file = nil
+local verify_file = nil
+local publish_seq = 0
+local publishes_since_key = 0
+local last_published = {}
+
+-- Arrays compare by content, everything else by value
+local function comparable(v)
+    if type(v) == "table" then
+        return table.concat(v, ",")
+    end
+    return v
+end
+
+local function write_to_stream(state)
+    publish_seq = publish_seq + 1
+    local record = {}
+    if stream_file == nil or publishes_since_key >= STREAM_KEYFRAME_INTERVAL then
+        -- Keyframe: restart the file with the full state
+        if stream_file then
+            stream_file:close()
+        end
+        stream_file = io.open(STREAM_FILE, "w")
+        if not stream_file then
+            return
+        end
+        for k, v in pairs(state) do
+            record[k] = v
+            last_published[k] = comparable(v)
+        end
+        record["_key"] = true
+        publishes_since_key = 0
+    else
+        for k, v in pairs(state) do
+            local cv = comparable(v)
+            if last_published[k] ~= cv then
+                record[k] = v
+                last_published[k] = cv
+            end
+        end
+        publishes_since_key = publishes_since_key + 1
+    end
+    record["_seq"] = publish_seq
+    stream_file:write(encode_json(record), "\n")
+    stream_file:flush()
+
+    if VERIFY_LOG then
+        if verify_file == nil then
+            verify_file = io.open(VERIFY_FILE, "w")
+        end
+        state["_seq"] = publish_seq
+        verify_file:write(encode_json(state), "\n")
+        verify_file:flush()
+        state["_seq"] = nil
+    end
+end
+
+-- Debug log to file with score tracking (handle kept open between publishes)
+local debug_log_file = nil
 local function write_debug_log(state)
-    local f = io.open("memory_debug.log", "a")
+    if debug_log_file == nil then
+        debug_log_file = io.open("memory_debug.log", "a")
+    end
+    local f = debug_log_file
     if f then
         f:write(string.format(
             "mode:%02X lives:%d death:%02X x:%d.%d power:%d score:%d raw:%s enemy_killed:%s status:%s\n",
@@ -203,7 +439,7 @@ local function write_debug_log(state)
             tostring(state["enemy_killed"]),
             state["game_status"]
         ))
-        f:close()
+        f:flush()
     end
 end
 
@@ -241,11 +477,29 @@ local function print_debug_terminal(state)
 end
 
 -- Main loop
+-- Edge-triggered fields (life_lost, enemy_killed, q_block_hit) compare against the
+-- previous publish, so events between publishes are still reported.
+local frame_counter = 0
 while true do
-    local game_state = read_game_state()
-    write_to_json(game_state)
-    write_debug_log(game_state)
-    log_score_change(game_state["_score"], game_state["_score_raw"])
-    print_debug_terminal(game_state)
+    if frame_counter % PUBLISH_INTERVAL == 0 then
+        -- Commands run before the read so the ack is published with the post-command state
+        poll_commands()
+        local game_state = read_game_state()
+        if OUTPUT_MODE == "stream" then
+            write_to_stream(game_state)
+        else
+            write_to_json(game_state)
+        end
+        if DEBUG_LOG then
+            write_debug_log(game_state)
+        end
+        if SCORE_LOG then
+            log_score_change(game_state["_score"], game_state["_score_raw"])
+        end
+        if CONSOLE_PRINT then
+            print_debug_terminal(game_state)
+        end
+    end
+    frame_counter = frame_counter + 1
     emu.frameadvance()
 end
@@ -0,0 +1,93 @@
+# bridge_check.py
+# Checks that the change-only stream output of bridge.lua decodes to the same
+# states as the full output.
+#
+# Against the real bridge: set OUTPUT_MODE = "stream" and VERIFY_LOG = true in
+# bridge.lua, play for a while, then run
+#     python bridge_check.py
+# Without the emulator, the Python stand-in produces both outputs:
+#     python bridge_check.py --stub 5000
+
+import argparse
+import json
+import random
+import sys
+
+from bridge_stream import STREAM_FILE, VERIFY_FILE, StreamReader, decode_lines
+
+
+def _load_full(path):
+    with open(path, "r") as f:
+        return {s["_seq"]: s for s in (json.loads(line) for line in f if line.strip())}
+
+
+def check_files(stream_path=STREAM_FILE, full_path=VERIFY_FILE):
+    """Decode the stream file and compare each state with the full log.
+
+    Only the states since the last keyframe are still in the stream file.
+    Returns (states_checked, mismatched_seqs).
+    """
+    full = _load_full(full_path)
+    with open(stream_path, "r") as f:
+        decoded = list(decode_lines(f))
+    mismatches = [s["_seq"] for s in decoded if full.get(s["_seq"]) != s]
+    return len(decoded), mismatches
+
+
+def check_stub(frames, publish_interval=1, keyframe_interval=50, seed=0):
+    """Run the bridge stand-in in stream mode and follow it with StreamReader.
+
+    The reader polls at random frames (so it sees keyframe rotations and multi-record
+    catch-ups) and every state it reports must equal the full state for that _seq.
+    Returns (reads_checked, mismatched_seqs).
+    """
+    from bridge_stub import BridgeStub
+
+    rng = random.Random(seed)
+    stub = BridgeStub(output_mode="stream", publish_interval=publish_interval,
+                      keyframe_interval=keyframe_interval, verify_log=True)
+    reader = StreamReader(stub.stream_file)
+    published = {}
+    reads, mismatches = 0, []
+    try:
+        for _ in range(frames):
+            stub.advance()
+            if stub.publish_seq and stub.publish_seq not in published:
+                published[stub.publish_seq] = dict(stub.last_published, _seq=stub.publish_seq)
+            if rng.random() < 0.2:
+                state = reader.read()
+                reads += 1
+                if published.get(state.get("_seq")) != state:
+                    mismatches.append(state.get("_seq"))
+    finally:
+        stub.stop()
+    return reads, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify bridge.lua stream output against full output")
+    parser.add_argument("--stream", default=STREAM_FILE)
+    parser.add_argument("--full", default=VERIFY_FILE)
+    parser.add_argument("--stub", type=int, metavar="FRAMES",
+                        help="run the Python bridge stand-in for FRAMES frames instead of reading bridge files")
+    parser.add_argument("--interval", type=int, default=1, help="publish interval for --stub")
+    args = parser.parse_args()
+
+    if args.stub:
+        checked, mismatches = check_stub(args.stub, publish_interval=args.interval)
+        # The stub also leaves its files behind, so check the decoder on them too
+        file_checked, file_mismatches = check_files(STREAM_FILE, VERIFY_FILE)
+        checked += file_checked
+        mismatches += file_mismatches
+    else:
+        checked, mismatches = check_files(args.stream, args.full)
+
+    if mismatches:
+        print(f"❌ {len(mismatches)} of {checked} decoded states differ from full output "
+              f"(first _seq: {mismatches[0]})")
+        sys.exit(1)
+    print(f"✅ {checked} decoded states match full output")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bridge_commands.py
+# Python -> bridge.lua command channel (savestate load/save)
+#
+# Protocol: Python atomically writes a single line "<id> <command> <arg>" to
+# COMMAND_FILE. bridge.lua polls the file once per frame, runs each new id once,
+# and publishes "cmd_ack" (id), "cmd_ok" and "cmd_frame" (emulator frame number)
+# in mario_memory.json together with the state read after the command ran.
+
+import os
+import time
+import memory_interface as mem
+
+COMMAND_FILE = "bridge_command.txt"
+
+_last_id = 0
+
+# Trace hooks (see session_trace.py): command ids are time based, so a replay
+# must hand back the recorded ids for the recorded acknowledgements to match.
+# Ack timeouts are wall-clock based too, so the number of polls each wait made
+# is recorded and a replay polls exactly that often.
+_trace_source = None
+_trace_observer = None
+_trace_wait_source = None
+_trace_wait_observer = None
+
+
+def set_trace_hooks(source=None, observer=None, wait_source=None, wait_observer=None):
+    global _trace_source, _trace_observer, _trace_wait_source, _trace_wait_observer
+    _trace_source = source
+    _trace_observer = observer
+    _trace_wait_source = wait_source
+    _trace_wait_observer = wait_observer
+
+
+def _next_id():
+    # Millisecond ids stay increasing across Python restarts, so a stale command
+    # file left behind by a previous run is never re-executed by the bridge.
+    global _last_id
+    _last_id = max(_last_id + 1, int(time.time() * 1000))
+    return _last_id
+
+
+def send_command(command, arg=0):
+    """Write a command for the bridge and return its id."""
+    if _trace_source is not None:
+        return _trace_source()
+    cmd_id = _next_id()
+    tmp_path = COMMAND_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{cmd_id} {command} {arg}\n")
+    os.replace(tmp_path, COMMAND_FILE)
+    if _trace_observer is not None:
+        _trace_observer(cmd_id)
+    return cmd_id
+
+
+def wait_for_ack(cmd_id, timeout=2.0, poll=0.002):
+    """Wait until the bridge acknowledges cmd_id.
+
+    Returns the bridge state published with the acknowledgement, or None on timeout.
+    """
+    if _trace_wait_source is not None:
+        for _ in range(_trace_wait_source()):
+            state = mem.get_state()
+            if state.get("cmd_ack") == cmd_id:
+                return state
+        return None
+    polls = 0
+    deadline = time.time() + timeout
+    result = None
+    while time.time() < deadline:
+        state = mem.get_state()
+        polls += 1
+        if state.get("cmd_ack") == cmd_id:
+            result = state
+            break
+        time.sleep(poll)
+    if _trace_wait_observer is not None:
+        _trace_wait_observer(polls)
+    return result
+
+
+def load_savestate(slot, timeout=2.0):
+    """Load savestate slot in the emulator. Returns the post-load state or None."""
+    state = wait_for_ack(send_command("load_state", slot), timeout)
+    if state is None:
+        print(f"[CMD] ⚠️ No acknowledgement for load_state {slot} within {timeout}s")
+    elif not state.get("cmd_ok", False):
+        print(f"[CMD] ❌ Bridge failed to load savestate slot {slot}")
+        return None
+    return state
+
+
+def save_savestate(slot, timeout=2.0):
+    """Save the current emulator state to slot. Returns the state or None."""
+    state = wait_for_ack(send_command("save_state", slot), timeout)
+    if state is None:
+        print(f"[CMD] ⚠️ No acknowledgement for save_state {slot} within {timeout}s")
+    elif not state.get("cmd_ok", False):
+        print(f"[CMD] ❌ Bridge failed to save savestate slot {slot}")
+        return None
+    return state
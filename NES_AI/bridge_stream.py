@@ -0,0 +1,89 @@
+# bridge_stream.py
+# Decoder for the change-only "stream" output of bridge.lua
+#
+# Each line of mario_memory.stream is a JSON object carrying "_seq" (publish
+# counter). A line with "_key": true holds the full state; the following lines
+# hold only the fields that changed since the previous publish. The bridge
+# truncates the file whenever it writes a keyframe, so the file always starts
+# with a keyframe.
+
+import json
+import os
+
+STREAM_FILE = "mario_memory.stream"
+VERIFY_FILE = "mario_memory.full.jsonl"
+
+
+def apply_record(state, record):
+    """Merge one stream record into state (in place). Returns the merged state."""
+    if record.get("_key"):
+        state.clear()
+    state.update(record)
+    state.pop("_key", None)
+    return state
+
+
+def decode_lines(lines):
+    """Yield the full state after each record of a stream (iterable of JSON lines)."""
+    state = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        yield dict(apply_record(state, json.loads(line)))
+
+
+class StreamReader:
+    """Incrementally follows a stream file and keeps the merged latest state.
+
+    Only complete lines are consumed. If the reader notices it missed records
+    (sequence gap, a truncated file, or landing mid-line after a rotation) it
+    rebuilds the state from the keyframe at the start of the file.
+    """
+
+    def __init__(self, path=STREAM_FILE):
+        self.path = path
+        self.offset = 0
+        self.seq = None
+        self.state = {}
+
+    def _resync(self):
+        self.offset = 0
+        self.seq = None
+        self.state = {}
+
+    def _consume(self, data):
+        """Apply complete lines from data. Returns False if a resync is needed."""
+        end = data.rfind(b"\n")
+        if end < 0:
+            return True
+        for line in data[:end + 1].splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return False
+            seq = record.get("_seq")
+            if not record.get("_key") and (self.seq is None or seq != self.seq + 1):
+                return False
+            apply_record(self.state, record)
+            self.seq = seq
+            self.offset += len(line)
+        return True
+
+    def read(self):
+        """Return a copy of the latest merged state ({} if nothing decoded yet)."""
+        last_good = dict(self.state)
+        for attempt in range(2):
+            try:
+                with open(self.path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size < self.offset:
+                        self._resync()
+                    f.seek(self.offset)
+                    data = f.read()
+            except OSError:
+                break
+            if self._consume(data):
+                break
+            self._resync()
+        # Caught the bridge mid-rotation: report the previous state and retry next read
+        return dict(self.state) if self.state else last_good
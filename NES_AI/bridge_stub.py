@@ -0,0 +1,183 @@
+# bridge_stub.py
+# Python stand-in for bridge.lua, used to exercise the file protocols without FCEUX.
+#
+# Publishes the same mario_memory.json fields as the real bridge and executes the
+# command channel (load_state / save_state) exactly like poll_commands() in bridge.lua.
+# Mario simply walks right while "playing" so state changes from frame to frame.
+# output_mode / publish_interval / keyframe_interval / verify_log mirror the
+# OUTPUT_MODE, PUBLISH_INTERVAL, STREAM_KEYFRAME_INTERVAL and VERIFY_LOG settings.
+#
+# Run directly for a quick round trip check:
+#     python bridge_stub.py
+
+import json
+import os
+import threading
+import time
+
+import bridge_commands
+import bridge_stream
+import memory_interface as mem
+
+
+class BridgeStub:
+    def __init__(self, memory_file=None, command_file=None, fps=60, output_mode="json",
+                 publish_interval=1, keyframe_interval=300, verify_log=False,
+                 stream_file=None, verify_file=None):
+        self.memory_file = memory_file or mem.MEMORY_FILE
+        self.command_file = command_file or bridge_commands.COMMAND_FILE
+        self.stream_file = stream_file or bridge_stream.STREAM_FILE
+        self.verify_file = verify_file or bridge_stream.VERIFY_FILE
+        self.fps = fps
+        self.output_mode = output_mode
+        self.publish_interval = publish_interval
+        self.keyframe_interval = keyframe_interval
+        self.verify_log = verify_log
+        self.publish_seq = 0
+        self.publishes_since_key = 0
+        self.last_published = {}
+        self._stream = None
+        self._verify = None
+        self.frame = 0
+        self.command_ack = {"id": 0, "ok": False, "frame": 0}
+        self.slots = {}
+        # Like bridge.lua, ignore a command file left over from an earlier session
+        stale = self.read_command()
+        self.last_command_id = int(stale[0]) if stale else 0
+        self.game = {
+            "mario_x": 40, "mario_y": 176, "lives": 3, "_score": 0,
+            "world": 0, "level": 0, "time_remaining": 400,
+            "game_status": "playing", "flagpole": False,
+        }
+        self._thread = None
+        self._stop = threading.Event()
+
+    def read_command(self):
+        try:
+            with open(self.command_file, "r") as f:
+                parts = f.readline().split()
+        except OSError:
+            return None
+        if len(parts) < 2 or not parts[0].isdigit():
+            return None
+        return parts
+
+    def poll_commands(self):
+        parts = self.read_command()
+        if parts is None:
+            return
+        cmd_id = int(parts[0])
+        if cmd_id <= self.last_command_id:
+            return
+        self.last_command_id = cmd_id
+
+        command = parts[1]
+        slot = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 1
+        ok = True
+        if command == "load_state" and slot in self.slots:
+            self.game = dict(self.slots[slot])
+        elif command == "save_state":
+            self.slots[slot] = dict(self.game)
+        else:
+            ok = False
+            print(f"[STUB] Cannot run '{command} {slot}'")
+        self.command_ack = {"id": cmd_id, "ok": ok, "frame": self.frame}
+
+    def advance(self):
+        """Emulate one frame of the bridge main loop."""
+        if self.game["game_status"] == "playing":
+            self.game["mario_x"] += 1
+            if self.frame % 24 == 0:
+                self.game["time_remaining"] = max(0, self.game["time_remaining"] - 1)
+            if self.frame % 90 == 0:
+                self.game["_score"] += 100
+        if self.frame % self.publish_interval == 0:
+            self.poll_commands()
+            if self.output_mode == "stream":
+                self.write_stream(self.read_game_state())
+            else:
+                self.write_state()
+        self.frame += 1
+
+    def read_game_state(self):
+        state = dict(self.game)
+        state["timestamp"] = int(time.time())
+        state["frame"] = self.frame
+        state["cmd_ack"] = self.command_ack["id"]
+        state["cmd_ok"] = self.command_ack["ok"]
+        state["cmd_frame"] = self.command_ack["frame"]
+        return state
+
+    def write_state(self):
+        tmp_path = self.memory_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.read_game_state(), f)
+        os.replace(tmp_path, self.memory_file)
+
+    def write_stream(self, state):
+        self.publish_seq += 1
+        if self._stream is None or self.publishes_since_key >= self.keyframe_interval:
+            if self._stream is not None:
+                self._stream.close()
+            self._stream = open(self.stream_file, "w")
+            record = dict(state, _key=True)
+            self.last_published = dict(state)
+            self.publishes_since_key = 0
+        else:
+            record = {k: v for k, v in state.items() if self.last_published.get(k) != v}
+            self.last_published.update(record)
+            self.publishes_since_key += 1
+        record["_seq"] = self.publish_seq
+        self._stream.write(json.dumps(record) + "\n")
+        self._stream.flush()
+
+        if self.verify_log:
+            if self._verify is None:
+                self._verify = open(self.verify_file, "w")
+            self._verify.write(json.dumps(dict(state, _seq=self.publish_seq)) + "\n")
+            self._verify.flush()
+
+    def _run(self):
+        delay = 1.0 / self.fps if self.fps else 0.0
+        while not self._stop.is_set():
+            self.advance()
+            if delay:
+                time.sleep(delay)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for f in (self._stream, self._verify):
+            if f is not None:
+                f.close()
+        self._stream = self._verify = None
+
+
+if __name__ == "__main__":
+    stub = BridgeStub().start()
+    try:
+        saved = bridge_commands.save_savestate(1)
+        assert saved is not None and saved["cmd_ok"], "save_state not acknowledged"
+        time.sleep(0.2)  # Let Mario walk away from the saved position
+
+        start = time.time()
+        loaded = bridge_commands.load_savestate(1)
+        elapsed = time.time() - start
+        assert loaded is not None, "load_state not acknowledged"
+        assert loaded["mario_x"] == saved["mario_x"], "state not restored"
+        print(f"✅ Savestate round trip OK - reset acknowledged at frame {loaded['cmd_frame']} "
+              f"in {elapsed * 1000:.1f} ms")
+
+        missing = bridge_commands.load_savestate(9, timeout=0.5)
+        assert missing is None, "loading an empty slot should fail"
+        print("✅ Failed command reported")
+    finally:
+        stub.stop()
@@ -0,0 +1,147 @@
+# cli.py
+# Single entry point for the training and tooling scripts
+#
+#     python cli.py train [--record TRACE | --replay TRACE]     # train.py
+#     python cli.py eval --env sim --num-envs 8                 # evaluate.py
+#     python cli.py simulate --episodes 20                      # headless training run on SimEnv
+#     python cli.py bench trace logs/session                    # session_trace.py
+#     python cli.py bench replay [--check]                      # replay_buffer.py storage comparison
+#     python cli.py bench networks --threads 1                  # backbone latency and size (agent.py)
+#     python cli.py bench imports                               # import-time budget check
+#     python cli.py sweep | pretrain | relabel | bridge-check   # the other tools
+#
+# Subcommands import their module only when they run, so the CLI itself starts
+# in milliseconds. Heavy or desktop-only dependencies (torch, imageio, pyautogui,
+# pygetwindow, keyboard) are imported inside the functions that use them; the
+# "bench imports" check keeps it that way.
+
+import sys
+
+# Subcommands that run a module's command line as-is
+SCRIPTS = {
+    "train": "train",
+    "eval": "evaluate",
+    "sweep": "sweep",
+    "pretrain": "pretrain",
+    "relabel": "reward_relabel",
+    "bridge-check": "bridge_check",
+}
+BENCH_SCRIPTS = {
+    "trace": "session_trace",
+    "replay": "replay_buffer",
+    "networks": "agent",
+}
+
+# Modules checked by "bench imports", and the imports none of them may trigger
+IMPORT_CHECK_MODULES = ("cli", "train", "evaluate", "sweep", "pretrain", "session_trace", "reward_relabel",
+                        "environments", "replay_buffer", "trajectory_dataset", "bridge_check")
+HEAVY_MODULES = ("torch", "imageio", "pyautogui", "pygetwindow", "keyboard", "PIL")
+
+
+def run_script(module, argv):
+    """Run module as if started with python module.py argv..."""
+    import runpy
+    sys.argv = [f"{module}.py"] + list(argv)
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def measure_import(module):
+    """Import module in a fresh interpreter. Returns (milliseconds, heavy modules it pulled in)."""
+    import json
+    import os
+    import subprocess
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "elapsed = (time.perf_counter() - start) * 1000\n"
+            f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n")
+    # Run next to this file so the flat modules resolve from any working directory
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=here)
+    elapsed, heavy = json.loads(out.stdout.strip().splitlines()[-1])
+    return elapsed, heavy
+
+
+def check_imports(budget_ms=300.0, modules=IMPORT_CHECK_MODULES):
+    """Print the import time of each module. Returns False if any exceeds budget_ms or imports a heavy module."""
+    ok = True
+    for module in modules:
+        elapsed, heavy = measure_import(module)
+        failed = elapsed > budget_ms or heavy
+        ok = ok and not failed
+        note = f" - imports {', '.join(heavy)}" if heavy else ""
+        print(f"{'❌' if failed else '✅'} {module:20s} {elapsed:7.1f} ms{note}")
+    print(f"{'✅ All imports' if ok else '❌ Some imports are'} within the {budget_ms:.0f} ms budget"
+          + ("" if ok else " or pull in heavy modules"))
+    return ok
+
+
+def simulate(argv):
+    """Train one agent on the simulated level, printing each episode."""
+    import argparse
+    import ast
+
+    from sweep import TRIAL_DEFAULTS, run_trial, split_params
+
+    parser = argparse.ArgumentParser(prog="cli.py simulate", description="Headless training run on SimEnv")
+    parser.add_argument("--episodes", type=int, default=50)
+    parser.add_argument("--max-steps", type=int, default=TRIAL_DEFAULTS["max_steps"])
+    parser.add_argument("--observation-mode", choices=("ram", "screen"), default="ram")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a sweep parameter or reward constant (repeatable)")
+    args = parser.parse_args(argv)
+
+    params = {"episodes": args.episodes, "max_steps": args.max_steps}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        params[name] = ast.literal_eval(value)
+    try:
+        split_params(params)
+    except ValueError as e:
+        parser.error(str(e))
+
+    class _Printer:
+        def put(self, row):
+            print(f"✅ Episode {row['episode']} - Max X: {row['max_x']} - Reward: {row['total_reward']:.2f} - "
+                  f"Steps: {row['steps']} - Epsilon: {row['epsilon']:.3f} ({row['elapsed']:.1f}s)")
+
+    summary = run_trial(0, params, _Printer(), observation_mode=args.observation_mode, seed=args.seed)
+    print(f"🏁 Mean max X over the last episodes: {summary['score']:.0f} (best {summary['best_max_x']})")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    commands = sorted(list(SCRIPTS) + ["simulate", "bench"])
+    if not argv or argv[0] in ("-h", "--help"):
+        print(f"usage: cli.py {{{','.join(commands)}}} [args...]")
+        print("Run 'python cli.py <command> --help' for the options of a command.")
+        return 0 if argv else 2
+
+    command, rest = argv[0], argv[1:]
+    if command in SCRIPTS:
+        run_script(SCRIPTS[command], rest)
+    elif command == "simulate":
+        simulate(rest)
+    elif command == "bench":
+        target = rest[0] if rest else None
+        if target in BENCH_SCRIPTS:
+            run_script(BENCH_SCRIPTS[target], rest[1:])
+        elif target == "imports":
+            import argparse
+            parser = argparse.ArgumentParser(prog="cli.py bench imports",
+                                             description="Check tool import times and heavy dependencies")
+            parser.add_argument("--budget-ms", type=float, default=300.0)
+            args = parser.parse_args(rest[1:])
+            return 0 if check_imports(args.budget_ms) else 1
+        else:
+            print(f"usage: cli.py bench {{{','.join(sorted(list(BENCH_SCRIPTS) + ['imports']))}}} [args...]")
+            return 2
+    else:
+        print(f"❌ Unknown command '{command}' (expected one of: {', '.join(commands)})")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,4 +16,49 @@ ACTIONS = [
 ]
 
 EPISODES = 3000
-MAX_STEPS = 500
\ No newline at end of file
+MAX_STEPS = 500
+
+# Observation source for the agent:
+#   "screen" - 84x84 grayscale frames grabbed from the emulator window (screen_capture.get_frame)
+#   "ram"    - compact numeric vector exported by bridge.lua (ram_observation.get_observation)
+# Must match EXPORT_RAM_OBS in bridge.lua when set to "ram".
+OBSERVATION_MODE = "screen"
+
+# Q-network (see BACKBONES in agent.py; "python agent.py" profiles them all)
+#   screen: "nature", "small", "wide", "separable"    ram: "mlp", "mlp_small"
+BACKBONE = None   # None = "nature" for screen, "mlp" for ram
+DUELING = False   # Dueling head: separate state value and action advantage streams
+
+# Episode reset strategy:
+#   "keyboard"  - wait for title/lives screens and press START (slow, several seconds)
+#   "savestate" - ask bridge.lua to load a savestate slot via the command channel (a few frames)
+RESET_MODE = "keyboard"
+# FCEUX savestate slots (1-10) to reset into; a random slot is picked each episode,
+# so several slots saved at different positions form a simple curriculum.
+SAVESTATE_SLOTS = [1]
+RESET_TIMEOUT = 2.0  # Seconds to wait for the bridge to acknowledge a command
+
+# Bridge output format; must match OUTPUT_MODE in bridge.lua
+#   "json"   - full state rewritten to mario_memory.json on every publish
+#   "stream" - changed fields only, appended to mario_memory.stream (see bridge_stream.py)
+MEMORY_FORMAT = "json"
+
+# Per-episode trajectory files for offline pretraining (see trajectory_dataset.py, pretrain.py)
+SAVE_TRAJECTORIES = True
+TRAJECTORY_DIR = "logs/trajectories"
+TRAJECTORY_CHUNK_SIZE = 500  # Steps per chunk file
+
+# Replay memory
+#   "raw"        - transitions kept as given in a deque (replay_buffer.ReplayBuffer)
+#   "compressed" - frames delta-encoded and compressed in chunks (replay_buffer.CompressedReplayBuffer),
+#                  many times more transitions per GB at some sampling cost
+REPLAY_STORAGE = "raw"
+REPLAY_CAPACITY = 10000
+REPLAY_CODEC = "zlib"  # "zlib" (fast) or "lzma" (smaller, slower)
+# Steps summed into each stored return (replay_buffer.NStepAccumulator); 1 = one-step TD targets
+N_STEP = 1
+
+# Memory accounting (see memory_budget.py)
+MEMORY_BUDGET_MB = None        # Whole-process budget; when set, replay capacity is derived from it instead of REPLAY_CAPACITY
+MEMORY_REPORT_EVERY = 10       # Episodes between per-subsystem memory reports (0 = off); logs/memory_log.csv gets every episode
+TRACEMALLOC_SNAPSHOTS = False  # Print the top allocation changes between episodes (slows training)
@@ -3,14 +3,25 @@
 
 import subprocess
 import time
-import keyboard  # Low-level keyboard input
 from config import EMULATOR_PATH, ROM_PATH
 
+# Trace replay (see session_trace.py) swaps key presses for a sink
+_input_sink = None
+
+def set_input_sink(sink=None):
+    global _input_sink
+    _input_sink = sink
+
 def launch_game():
     subprocess.Popen([EMULATOR_PATH, ROM_PATH])
     time.sleep(1.5)  # Let the emulator start
 
 def send_input(action):
+    if _input_sink is not None:
+        _input_sink(action)
+        return
+
+    import keyboard  # Low-level keyboard input; needs a desktop session
     key_map = {
         "UP": "w",
         "DOWN": "s",
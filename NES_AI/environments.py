@@ -0,0 +1,211 @@
+# environments.py
+# Step-by-step environments sharing one interface:
+#     obs = env.reset()                          # env.start_state: game_state to prime RewardTracker, or None
+#     obs, game_state, done = env.step(action_idx)
+#
+# EmulatorEnv drives FCEUX through the bridge like train.py does.
+# SimEnv is a small headless side-scroller with the same observations (84x84
+# frames or the bridge RAM observation) and game_state fields, for fast
+# evaluation, sweeps and benchmarks without the emulator.
+
+import numpy as np
+
+from config import ACTIONS, OBSERVATION_MODE
+from ram_observation import ENEMY_SLOTS, TILE_COLS, TILE_ROWS, encode_observation
+
+
+class EmulatorEnv:
+    """The live emulator, reset and observed exactly like the training loop."""
+
+    def __init__(self):
+        import train
+        self._train = train
+        self.start_state = None
+
+    def reset(self):
+        obs = self._train.reset_game()
+        self.start_state = (self._train.read_game_state()
+                            if self._train.RESET_MODE == "savestate" else None)
+        return obs
+
+    def step(self, action_idx):
+        self._train.send_input(ACTIONS[action_idx])
+        obs = self._train.observe()
+        game_state = self._train.read_game_state()
+        done = self._train.mem.get_game_status() in ("game_over", "dying", "transition")
+        return obs, game_state, done
+
+
+class SimEnv:
+    """
+    Headless stand-in for World 1-1: flat ground with pits, walking enemies and
+    a flagpole at X=3200. One step holds the action for FRAMES_PER_STEP frames.
+    """
+
+    FRAMES_PER_STEP = 8
+    GROUND_Y = 176          # Mario's Y when standing on the ground
+    FLAGPOLE_X = 3200
+    PITS = ((720, 32), (1376, 48), (2208, 48), (2720, 32))     # (start X, width)
+    ENEMIES = (480, 880, 1184, 1600, 1808, 2400, 2880)          # Starting X of each enemy
+    Q_BLOCKS = (256, 336, 1248, 1984, 2560)                     # Decorative ? blocks (row 8)
+
+    def __init__(self, observation_mode=OBSERVATION_MODE, seed=None):
+        self.observation_mode = observation_mode
+        self.rng = np.random.default_rng(seed)
+        self.start_state = None
+        self.lives = 3
+        self.reset()
+
+    # --- Level geometry ---------------------------------------------------
+    def _in_pit(self, x):
+        return any(start <= x < start + width for start, width in self.PITS)
+
+    def _tile(self, col, row):
+        x = col * 16
+        if row == TILE_ROWS - 1:
+            return 0 if self._in_pit(x + 8) else 1
+        if row == 8 and x in self.Q_BLOCKS:
+            return 2
+        return 0
+
+    # --- Episode control --------------------------------------------------
+    def reset(self):
+        if self.lives <= 0:
+            self.lives = 3
+        self.x = 40.0
+        self.y = float(self.GROUND_Y)
+        self.vx = 0.0
+        self.vy = 0.0
+        self.frame = 0
+        self.score = 0
+        self.time_remaining = 400
+        self.flagpole = False
+        self.status = "playing"
+        # Small random offsets keep repeated episodes from being identical
+        self.enemies = [[ex + float(self.rng.integers(-24, 25)), True] for ex in self.ENEMIES]
+        return self._observe()
+
+    def step(self, action_idx):
+        keys = ACTIONS[action_idx].split('+')
+        for _ in range(self.FRAMES_PER_STEP):
+            self._advance(keys)
+            if self.status != "playing":
+                break
+        done = self.status != "playing"
+        return self._observe(), self.game_state(), done
+
+    def _advance(self, keys):
+        on_ground = self.y >= self.GROUND_Y and not self._in_pit(self.x + 8)
+
+        # Horizontal movement: B runs, no direction slows down
+        top_speed = 2.5 if "B" in keys else 1.5
+        if "RIGHT" in keys:
+            self.vx = min(self.vx + 0.15, top_speed)
+        elif "LEFT" in keys:
+            self.vx = max(self.vx - 0.15, -top_speed)
+        else:
+            self.vx *= 0.85
+        self.x = max(0.0, self.x + self.vx)
+
+        # Jumping and gravity
+        if "A" in keys and on_ground:
+            self.vy = -5.0
+        self.vy = min(self.vy + 0.3, 5.0)
+        self.y += self.vy
+        if self.y >= self.GROUND_Y and not self._in_pit(self.x + 8) and self.y - self.vy <= self.GROUND_Y:
+            self.y = float(self.GROUND_Y)
+            self.vy = 0.0
+        if self.y > 240:
+            return self._die()
+
+        # Enemies walk left; stomp from above, otherwise they kill Mario
+        for enemy in self.enemies:
+            if not enemy[1]:
+                continue
+            if abs(enemy[0] - self.x) < 256:
+                enemy[0] -= 0.5
+            if abs(enemy[0] - self.x) < 12 and abs(self.GROUND_Y - self.y) < 12:
+                if self.vy > 0 and self.y < self.GROUND_Y - 2:
+                    enemy[1] = False
+                    self.score += 100
+                    self.vy = -3.0
+                else:
+                    return self._die()
+
+        self.frame += 1
+        if self.frame % 24 == 0:
+            self.time_remaining -= 1
+            if self.time_remaining <= 0:
+                self.time_remaining = 0
+                return self._die()
+        if self.x >= self.FLAGPOLE_X:
+            self.flagpole = True
+            self.score += 5000
+            self.status = "transition"
+
+    def _die(self):
+        self.lives -= 1
+        self.status = "game_over" if self.lives <= 0 else "dying"
+
+    # --- Observations -----------------------------------------------------
+    def bridge_state(self):
+        """The state as bridge.lua would publish it (with EXPORT_RAM_OBS = true)."""
+        x = int(self.x)
+        first_col = x // 16 - 2
+        tiles = [self._tile(first_col + c, row) for row in range(TILE_ROWS) for c in range(TILE_COLS)]
+        nearby = sorted((e for e in self.enemies if e[1] and abs(e[0] - x) < 256),
+                        key=lambda e: abs(e[0] - x))[:ENEMY_SLOTS]
+        enemies = []
+        for enemy in nearby:
+            enemies += [1, int(enemy[0]) - x, self.GROUND_Y]
+        enemies += [0] * (ENEMY_SLOTS * 3 - len(enemies))
+        return {
+            "mario_x": x, "mario_y": int(self.y), "lives": self.lives, "_score": self.score,
+            "world": 0, "level": 0, "time_remaining": self.time_remaining,
+            "flagpole": self.flagpole, "game_status": self.status, "frame": self.frame,
+            "ram_tiles": tiles, "ram_enemies": enemies,
+            "mario_vx": int(self.vx * 16), "mario_vy": int(round(self.vy)),
+        }
+
+    def game_state(self):
+        """The game_state dict train.read_game_state would build."""
+        return {
+            'x': int(self.x),
+            'score': self.score,
+            'lives': self.lives,
+            'flagpole': self.flagpole,
+            'world': 0,
+            'level': 0,
+            'time_remaining': self.time_remaining
+        }
+
+    def _observe(self):
+        state = self.bridge_state()
+        if self.observation_mode == "ram":
+            return encode_observation(state)
+        return self._render(state)
+
+    def _render(self, state):
+        """84x84 grayscale frame in [0, 1] (uint8 / 255 like screen_capture)."""
+        tiles = np.asarray(state["ram_tiles"], dtype=np.uint8).reshape(TILE_ROWS, TILE_COLS)
+        palette = np.array([0.55, 0.25, 0.8])
+        canvas = np.kron(palette[tiles], np.ones((16, 16)))
+        left = (state["mario_x"] // 16 - 2) * 16
+        for enemy in self.enemies:
+            ex = int(enemy[0]) - left
+            if enemy[1] and 0 <= ex < canvas.shape[1] - 16:
+                canvas[self.GROUND_Y:self.GROUND_Y + 16, ex:ex + 16] = 0.1
+        mx, my = state["mario_x"] - left, min(max(state["mario_y"], 0), canvas.shape[0] - 16)
+        canvas[my:my + 16, mx:mx + 16] = 0.95
+        rows = np.linspace(0, canvas.shape[0] - 1, 84).astype(int)
+        cols = np.linspace(0, canvas.shape[1] - 1, 84).astype(int)
+        return np.rint(canvas[np.ix_(rows, cols)] * 255) / 255.0
+
+
+def make_env(kind="sim", **kwargs):
+    """Create an environment by name: "sim" or "emulator"."""
+    if kind == "sim":
+        return SimEnv(**kwargs)
+    if kind == "emulator":
+        return EmulatorEnv()
+    raise ValueError(f"unknown environment '{kind}'")
@@ -0,0 +1,156 @@
+# evaluate.py
+# Greedy evaluation of a saved checkpoint, without exploration, training,
+# video recording or per-step printing.
+#
+#     python evaluate.py --env sim --num-envs 8 --episodes 40
+#     python evaluate.py --env emulator --episodes 5
+#
+# With several environments, all active ones are stepped in lockstep and their
+# observations go through the network as one batch per decision.
+
+import argparse
+import json
+import time
+import numpy as np
+
+from config import ACTIONS, MAX_STEPS
+from environments import make_env
+from reward_tracker import RewardTracker
+
+
+def latency_stats(latencies):
+    """Percentiles of decision latencies (seconds in, milliseconds out)."""
+    if not latencies:
+        return {}
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def evaluate(agent, envs, episodes, max_steps=MAX_STEPS, reward_params=None):
+    """
+    Run greedy episodes spread over envs.
+
+    Returns:
+        dict with per-episode results, aggregate metrics and decision latency percentiles
+    """
+    indices = [ACTIONS.index(a) for a in ACTIONS if a != "START"]
+    trackers = [RewardTracker(reward_params) for _ in envs]
+    episode_results = []
+    latencies = []
+    steps_taken = 0
+    started = 0
+
+    # Per-env episode state: observation, total reward, steps so far (None = idle)
+    slots = [None] * len(envs)
+
+    def start_episode(i):
+        nonlocal started
+        obs = envs[i].reset()
+        trackers[i].reset_episode(envs[i].start_state)
+        slots[i] = [obs, 0.0, 0]
+        started += 1
+
+    for i in range(min(len(envs), episodes)):
+        start_episode(i)
+
+    wall_start = time.perf_counter()
+    while any(slot is not None for slot in slots):
+        active = [i for i, slot in enumerate(slots) if slot is not None]
+        t0 = time.perf_counter()
+        actions = agent.greedy_actions([slots[i][0] for i in active], indices)
+        latencies.append(time.perf_counter() - t0)
+
+        for i, action in zip(active, actions):
+            obs, game_state, done = envs[i].step(action)
+            reward, _ = trackers[i].calculate_reward(game_state)
+            slot = slots[i]
+            slot[0] = obs
+            slot[1] += reward
+            slot[2] += 1
+            steps_taken += 1
+            if done or slot[2] >= max_steps:
+                tracker = trackers[i]
+                episode_results.append({
+                    "env": i,
+                    "steps": slot[2],
+                    "total_reward": slot[1],
+                    "max_x": tracker.max_x,
+                    "flagpole": tracker.flagpole_triggered,
+                    "breakdown": tracker.get_episode_summary(),
+                })
+                slots[i] = None
+                if started < episodes:
+                    start_episode(i)
+    elapsed = time.perf_counter() - wall_start
+
+    max_x = np.array([r["max_x"] for r in episode_results], dtype=np.float64)
+    breakdown_keys = episode_results[0]["breakdown"].keys() if episode_results else ()
+    return {
+        "episodes": len(episode_results),
+        "mean_max_x": float(max_x.mean()) if len(max_x) else 0.0,
+        "best_max_x": float(max_x.max()) if len(max_x) else 0.0,
+        "flagpole_rate": float(np.mean([r["flagpole"] for r in episode_results])) if episode_results else 0.0,
+        "mean_reward": float(np.mean([r["total_reward"] for r in episode_results])) if episode_results else 0.0,
+        "mean_breakdown": {k: float(np.mean([r["breakdown"][k] for r in episode_results]))
+                           for k in breakdown_keys},
+        "decision_latency": latency_stats(latencies),
+        "decisions": len(latencies),
+        "steps": steps_taken,
+        "steps_per_sec": steps_taken / elapsed if elapsed > 0 else 0.0,
+        "results": episode_results,
+    }
+
+
+def print_report(report):
+    print(f"📊 {report['episodes']} episodes - Max X mean {report['mean_max_x']:.0f} "
+          f"best {report['best_max_x']:.0f} - Flagpole rate {report['flagpole_rate']:.2f} - "
+          f"Mean reward {report['mean_reward']:.2f}")
+    print("   Breakdown: " + " ".join(f"{k}:{v:.1f}" for k, v in report["mean_breakdown"].items() if v))
+    lat = report["decision_latency"]
+    if lat:
+        print(f"⏱️ Decision latency p50 {lat['p50_ms']:.3f} ms - p90 {lat['p90_ms']:.3f} ms - "
+              f"p99 {lat['p99_ms']:.3f} ms - max {lat['max_ms']:.3f} ms "
+              f"({report['decisions']} decisions, {report['steps_per_sec']:.1f} env steps/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Greedy evaluation of a saved DQN checkpoint")
+    parser.add_argument("--model", default="models/dqn_model.pth")
+    parser.add_argument("--env", choices=("sim", "emulator"), default="sim")
+    parser.add_argument("--num-envs", type=int, default=1, help="simulated environments stepped in lockstep")
+    parser.add_argument("--episodes", type=int, default=10)
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the full report as JSON")
+    args = parser.parse_args()
+
+    from agent import load_agent
+
+    # Build the network the checkpoint was trained with; never evaluate untrained weights
+    try:
+        agent = load_agent(args.model)
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+    if args.env == "emulator":
+        if args.num_envs != 1:
+            parser.error("the emulator supports a single environment")
+        envs = [make_env("emulator")]
+    else:
+        envs = [make_env("sim", observation_mode=agent.observation_mode, seed=args.seed + i)
+                for i in range(args.num_envs)]
+
+    report = evaluate(agent, envs, args.episodes, args.max_steps)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
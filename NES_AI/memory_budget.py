@@ -0,0 +1,174 @@
+# memory_budget.py
+# Memory accounting per subsystem and replay sizing from a global budget
+#
+# Subsystems (replay memory, model + optimizer, trajectory and trace buffers)
+# report their live bytes through memory_bytes() methods; MemoryMonitor collects
+# them together with the process RSS at episode boundaries, optionally diffing
+# tracemalloc snapshots to show which lines allocated the growth.
+#
+#     python memory_budget.py --budget-mb 8000     # replay capacity per observation mode / storage
+
+import os
+import sys
+import numpy as np
+
+# Estimated bytes per stored transition, used to size replay memory from a budget.
+# Raw storage keeps the arrays it is given (screen frames are float64 84x84, one new
+# frame per transition since next_state is the next state); compressed storage is
+# estimated at a conservative 4x over uint8 frames, well below what it usually reaches.
+# Both hold for n-step transitions: NStepAccumulator passes each observation on once
+# (the same array object, or one frame number in the compressed frame stream).
+TRANSITION_BYTES = {
+    ("screen", "raw"): 84 * 84 * 8 + 600,
+    ("ram", "raw"): 227 * 4 * 2 + 600,
+    ("screen", "compressed"): 84 * 84 // 4 + 400,
+    ("ram", "compressed"): 227 * 4 // 2 + 400,
+}
+
+
+def deep_nbytes(obj, seen=None):
+    """
+    Approximate live bytes of obj and everything it references.
+
+    Counts array data (NumPy arrays, torch tensors), bytes and the containers
+    holding them; objects referenced more than once are counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        # Views share their base's memory
+        return obj.nbytes if obj.base is None else deep_nbytes(obj.base, seen)
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):
+        return obj.element_size() * obj.nelement()
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_nbytes(k, seen) + deep_nbytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == "deque":
+        size += sum(deep_nbytes(item, seen) for item in obj)
+    return size
+
+
+def process_rss():
+    """Resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def replay_capacity_for_budget(budget_bytes, observation_mode, storage, used_bytes=None,
+                               headroom=0.2, minimum=1000):
+    """
+    Replay capacity that fits in what is left of budget_bytes.
+
+    Args:
+        used_bytes: memory already in use (defaults to the current process RSS)
+        headroom: fraction of the remaining budget kept free for everything else
+    """
+    if used_bytes is None:
+        used_bytes = process_rss() or 0
+    free = max(0, budget_bytes - used_bytes) * (1 - headroom)
+    return max(minimum, int(free // TRANSITION_BYTES[(observation_mode, storage)]))
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024 or unit == "GiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class MemoryMonitor:
+    """
+    Collects live bytes per registered subsystem at episode boundaries.
+
+    Args:
+        budget_bytes: optional process budget; a warning is printed when RSS exceeds it
+        report_every: episodes between printed reports (0 = never print)
+        tracemalloc_snapshots: diff tracemalloc snapshots between episodes (slows allocation-heavy code)
+        log_file: CSV receiving one row per episode with every subsystem's bytes
+    """
+
+    def __init__(self, budget_bytes=None, report_every=10, tracemalloc_snapshots=False,
+                 log_file="logs/memory_log.csv", top=10):
+        self.budget_bytes = budget_bytes
+        self.report_every = report_every
+        self.log_file = log_file
+        self.top = top
+        self.sources = {}
+        self._snapshot = None
+        self.tracemalloc = None
+        if tracemalloc_snapshots:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def register(self, name, source):
+        """source: callable returning the subsystem's live bytes (re-evaluated at each report)."""
+        self.sources[name] = source
+
+    def report(self):
+        """{subsystem: bytes, ..., "rss": process bytes or None}."""
+        usage = {name: int(source()) for name, source in self.sources.items()}
+        usage["rss"] = process_rss()
+        return usage
+
+    def episode_end(self, episode):
+        usage = self.report()
+        self._log(episode, usage)
+        rss = usage["rss"]
+        if self.report_every and episode % self.report_every == 0:
+            parts = [f"{name}: {format_bytes(n)}" for name, n in usage.items() if name != "rss"]
+            if rss is not None:
+                parts.append(f"RSS: {format_bytes(rss)}")
+            print("🧮 Memory - " + " | ".join(parts))
+        if self.budget_bytes and rss is not None and rss > self.budget_bytes:
+            print(f"⚠️ Process RSS {format_bytes(rss)} exceeds the {format_bytes(self.budget_bytes)} memory budget")
+        if self.tracemalloc is not None:
+            self._diff_snapshot(episode)
+        return usage
+
+    def _log(self, episode, usage):
+        if not self.log_file:
+            return
+        os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+        new = not os.path.exists(self.log_file)
+        with open(self.log_file, "a") as f:
+            if new:
+                f.write("episode," + ",".join(usage) + "\n")
+            f.write(f"{episode}," + ",".join("" if v is None else str(v) for v in usage.values()) + "\n")
+
+    def _diff_snapshot(self, episode):
+        snapshot = self.tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self._snapshot, "lineno")[:self.top]
+        self._snapshot = snapshot
+        print(f"🔬 Episode {episode} - top allocation changes since the last episode:")
+        for stat in stats:
+            frame = stat.traceback[0]
+            print(f"   {format_bytes(stat.size_diff):>10s} ({format_bytes(stat.size)} live) "
+                  f"{os.path.basename(frame.filename)}:{frame.lineno}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay capacity that fits a memory budget")
+    parser.add_argument("--budget-mb", type=float, required=True)
+    parser.add_argument("--used-mb", type=float, default=1500,
+                        help="memory in use before the replay memory (torch, model, emulator bridge)")
+    args = parser.parse_args()
+
+    for (mode, storage), per_transition in TRANSITION_BYTES.items():
+        capacity = replay_capacity_for_budget(args.budget_mb * 2**20, mode, storage, args.used_mb * 2**20)
+        print(f"{mode:6s} {storage:10s} ~{format_bytes(per_transition):>10s}/transition -> capacity {capacity}")
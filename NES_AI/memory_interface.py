@@ -2,10 +2,41 @@
 import json
 import os
 import time
+from config import MEMORY_FORMAT
+from bridge_stream import STREAM_FILE, StreamReader
 
 MEMORY_FILE = "mario_memory.json"
 
+_stream_reader = None
+
+# Trace hooks (see session_trace.py): a source replaces the bridge entirely,
+# an observer sees every state read from the bridge.
+_trace_source = None
+_trace_observer = None
+
+def set_trace_hooks(source=None, observer=None):
+    global _trace_source, _trace_observer
+    _trace_source = source
+    _trace_observer = observer
+
 def _read_memory(retries=5, delay=0.01):
+    if _trace_source is not None:
+        return _trace_source()
+    if MEMORY_FORMAT == "stream":
+        state = _read_stream()
+    else:
+        state = _read_json(retries, delay)
+    if _trace_observer is not None:
+        _trace_observer(state)
+    return state
+
+def _read_stream():
+    global _stream_reader
+    if _stream_reader is None:
+        _stream_reader = StreamReader(STREAM_FILE)
+    return _stream_reader.read()
+
+def _read_json(retries=5, delay=0.01):
     for attempt in range(retries):
         if not os.path.exists(MEMORY_FILE):
             if attempt < retries - 1:
@@ -26,6 +57,10 @@ def _read_memory(retries=5, delay=0.01):
 
     return {}
 
+def get_state():
+    """Return the full bridge state dict from a single read."""
+    return _read_memory()
+
 def get_mario_position():
     mem = _read_memory()
     return mem.get("mario_x", 0), mem.get("mario_y", 0)
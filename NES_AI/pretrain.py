@@ -0,0 +1,85 @@
+# pretrain.py
+# Offline pretraining of the DQN from stored trajectories (see trajectory_dataset.py)
+#
+#     python pretrain.py --mode bc --steps 20000              # behavior cloning
+#     python pretrain.py --mode dqn --steps 50000 --workers 2  # offline TD learning
+#
+# The result is saved like a normal checkpoint, so train.py starts from it with
+# the given --epsilon instead of exploring from 1.0.
+
+import argparse
+import itertools
+import time
+
+from config import TRAJECTORY_DIR
+from trajectory_dataset import chunk_observation_mode, iter_batches, list_chunks
+
+
+def _batches(paths, batch_size, workers, seed):
+    # Loop over the dataset as many times as the step budget needs
+    for epoch in itertools.count():
+        yielded = False
+        for batch in iter_batches(paths, batch_size=batch_size, workers=workers,
+                                  seed=None if seed is None else seed + epoch):
+            yielded = True
+            yield batch
+        if not yielded:
+            raise ValueError("not enough stored steps for a single batch")
+
+
+def pretrain(agent, paths, mode="dqn", steps=10000, batch_size=32, workers=0,
+             target_update=1000, log_every=1000, seed=None):
+    """Run offline updates on agent. Returns the mean loss of the last log window."""
+    losses = []
+    mean_loss = None
+    start = time.time()
+    batches = _batches(paths, batch_size, workers, seed)
+    for step, (states, actions, rewards, next_states, dones) in enumerate(itertools.islice(batches, steps), 1):
+        if mode == "bc":
+            losses.append(agent.imitate(states, actions))
+        else:
+            losses.append(agent.learn(states, actions, rewards, next_states, dones))
+            if step % target_update == 0:
+                agent.update_target()
+        if step % log_every == 0:
+            mean_loss = sum(l.item() for l in losses) / len(losses)
+            print(f"📚 Step {step}/{steps} - Loss: {mean_loss:.4f} - {step / (time.time() - start):.1f} steps/s")
+            losses = []
+    agent.update_target()
+    if losses:
+        mean_loss = sum(l.item() for l in losses) / len(losses)
+    return mean_loss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pretrain the DQN from stored trajectories")
+    parser.add_argument("--mode", choices=("dqn", "bc"), default="dqn",
+                        help="offline TD learning or behavior cloning of the stored actions")
+    parser.add_argument("--data", default=TRAJECTORY_DIR, help="trajectory directory (searched recursively)")
+    parser.add_argument("--steps", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=0, help="processes loading chunks in the background")
+    parser.add_argument("--epsilon", type=float, default=0.3, help="epsilon stored with the pretrained model")
+    parser.add_argument("--model", default="models/dqn_model.pth")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    paths = list_chunks(args.data)
+    if not paths:
+        parser.error(f"no trajectory chunks found in {args.data}")
+    modes = sorted({chunk_observation_mode(path) for path in paths})
+    if len(modes) > 1:
+        parser.error(f"{args.data} mixes {' and '.join(modes)} trajectories; point --data at a single run")
+    print(f"📂 {len(paths)} {modes[0]} trajectory chunks in {args.data}")
+
+    from agent import Agent
+    agent = Agent(observation_mode=modes[0])
+    model_path = args.model if args.fresh else agent.resume(args.model)
+    pretrain(agent, paths, mode=args.mode, steps=args.steps, batch_size=args.batch_size,
+             workers=args.workers)
+    agent.epsilon = args.epsilon
+    agent.save_model(model_path)
+
+
+if __name__ == "__main__":
+    main()
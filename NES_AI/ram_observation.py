@@ -0,0 +1,48 @@
+# ram_observation.py
+# Compact numeric observation decoded from the bridge.lua RAM export
+
+import numpy as np
+import memory_interface as mem
+
+# Must match OBS_ROWS / OBS_COLS / ENEMY_SLOTS in bridge.lua
+TILE_ROWS = 13
+TILE_COLS = 16
+ENEMY_SLOTS = 5
+
+TILE_SIZE = TILE_ROWS * TILE_COLS
+ENEMY_SIZE = ENEMY_SLOTS * 3
+MARIO_SIZE = 4  # x within screen page, y, x velocity, y velocity
+RAM_OBS_SIZE = TILE_SIZE + ENEMY_SIZE + MARIO_SIZE
+
+
+def encode_observation(state):
+    """Convert a bridge state dict into a float32 vector of length RAM_OBS_SIZE.
+
+    Values are scaled to roughly [-1, 1]. Missing fields (e.g. the bridge was
+    started with EXPORT_RAM_OBS = false) are left as zeros.
+    """
+    obs = np.zeros(RAM_OBS_SIZE, dtype=np.float32)
+
+    tiles = state.get("ram_tiles")
+    if tiles is not None and len(tiles) == TILE_SIZE:
+        # 0 = empty, 1 = solid, 2 = question block
+        obs[:TILE_SIZE] = np.asarray(tiles, dtype=np.float32) / 2.0
+
+    enemies = state.get("ram_enemies")
+    if enemies is not None and len(enemies) == ENEMY_SIZE:
+        slots = np.asarray(enemies, dtype=np.float32).reshape(ENEMY_SLOTS, 3)
+        slots[:, 1] = np.clip(slots[:, 1] / 256.0, -1.0, 1.0)  # X offset from Mario
+        slots[:, 2] = slots[:, 2] / 240.0                      # Y position
+        obs[TILE_SIZE:TILE_SIZE + ENEMY_SIZE] = slots.ravel()
+
+    mario = obs[TILE_SIZE + ENEMY_SIZE:]
+    mario[0] = (state.get("mario_x", 0) % 256) / 256.0
+    mario[1] = state.get("mario_y", 0) / 240.0
+    mario[2] = state.get("mario_vx", 0) / 40.0
+    mario[3] = state.get("mario_vy", 0) / 8.0
+    return obs
+
+
+def get_observation():
+    """Read the bridge once and return the encoded RAM observation."""
+    return encode_observation(mem.get_state())
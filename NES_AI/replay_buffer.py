@@ -1,21 +1,529 @@
 # Experience replay buffer
 # replay_buffer.py
 
+import itertools
+import lzma
 import random
+import threading
+import time
+import zlib
 import numpy as np
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-class ReplayBuffer:
+from memory_budget import deep_nbytes
+from screen_capture import pack_observation, unpack_observation
+
+class _EpisodeStarts:
+    """Start game_state of each episode that still has stored transitions, for reward relabeling."""
+
+    def set_episode_start(self, episode, game_state):
+        """Record the state an episode started from (see RewardTracker.reset_episode)."""
+        self.start_states[episode] = game_state
+        # Forget episodes whose transitions have all been evicted
+        oldest = self.game_states[0] if self.game_states else None
+        if oldest is not None and "episode" in oldest:
+            for old in [e for e in self.start_states if e < oldest["episode"]]:
+                del self.start_states[old]
+
+
+class ReplayBuffer(_EpisodeStarts):
     def __init__(self, capacity):
         self.buffer = deque(maxlen=capacity)
+        # Raw game_state per transition (aligned with buffer) for offline reward relabeling
+        self.game_states = deque(maxlen=capacity)
+        self.start_states = {}  # episode -> start game_state (set_episode_start)
+        self.evicted = 0  # transitions pushed out by newer ones
 
-    def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
+    def push(self, state, action, reward, next_state, done, game_state=None, discount=None):
+        # discount: gamma^n of an n-step transition (see NStepAccumulator); None for one step
+        if len(self.buffer) == self.buffer.maxlen:
+            self.evicted += 1
+        self.buffer.append((state, action, reward, next_state, done, discount))
+        self.game_states.append(game_state)
 
     def sample(self, batch_size):
+        """Returns (states, actions, rewards, next_states, dones, discounts); one-step discounts are NaN."""
         batch = random.sample(self.buffer, batch_size)
-        state, action, reward, next_state, done = map(np.array, zip(*batch))
-        return state, action, reward, next_state, done
+        columns = list(zip(*batch))
+        state, action, reward, next_state, done = map(np.array, columns[:5])
+        discount = np.array(columns[5], dtype=np.float32)
+        return state, action, reward, next_state, done, discount
+
+    def set_rewards(self, rewards, start=0):
+        """Replace the rewards of the stored transitions from the start-th oldest on (oldest first)."""
+        rewards = [t[2] for t in itertools.islice(self.buffer, start)] + list(rewards)
+        self.buffer = deque(
+            ((state, action, float(reward), next_state, done, discount)
+             for (state, action, _, next_state, done, discount), reward in zip(self.buffer, rewards)),
+            maxlen=self.buffer.maxlen)
+
+    def stores_n_step(self):
+        return any(t[5] is not None for t in self.buffer)
+
+    def memory_bytes(self):
+        """Live bytes of the stored transitions and game states."""
+        seen = set()
+        return sum(deep_nbytes(items, seen) for items in (self.buffer, self.game_states, self.start_states))
 
     def __len__(self):
         return len(self.buffer)
+
+
+_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=1), lzma.decompress),
+}
+
+
+class CompressedReplayBuffer(_EpisodeStarts):
+    """
+    Replay buffer that keeps observations in compressed chunks.
+
+    Each observation is stored once in a frame stream (a transition's next_state
+    is normally the following transition's state). Screen frames are packed to
+    uint8; every chunk_size frames are XOR-delta encoded against the previous
+    frame and compressed with zlib or lzma. Sampling decompresses each needed
+    chunk once per batch, keeps the last cache_chunks decoded chunks in an LRU
+    cache, and with prefetch=True prepares the next batch on a background thread
+    while the learner works on the current one (zlib and lzma release the GIL).
+
+    Same interface as ReplayBuffer (push, sample, set_rewards, set_episode_start, game_states, len).
+    """
+
+    def __init__(self, capacity, chunk_size=16, codec="zlib", cache_chunks=16, prefetch=True):
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.compress, self.decompress = _CODECS[codec]
+        self.cache_chunks = cache_chunks
+
+        # Transitions live in ring arrays; states are frame numbers in the frame stream
+        self.state_idx = np.zeros(capacity, dtype=np.int64)
+        self.next_idx = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.discounts = np.full(capacity, np.nan, dtype=np.float32)
+        self.position = 0
+        self.size = 0
+        self.evicted = 0
+        self.game_states = deque(maxlen=capacity)
+        self.start_states = {}
+
+        self.frame_shape = None
+        self.frame_dtype = None
+        self.frame_count = 0
+        self.open_chunk = []          # Frames of the chunk being filled, uncompressed
+        self.chunks = {}              # chunk id -> compressed bytes
+        self.oldest_chunk = 0         # Chunks below this id have been dropped
+        # Rows do not reference frames in frame order (several envs, n-step windows), so the
+        # oldest frame in use is tracked as a sliding-window minimum over the ring:
+        # (frame number, push number) with increasing frame numbers, front = oldest in use
+        self._live_min = deque()
+        self._pushes = 0
+        self._keep_from = None        # Oldest frame a push_frames caller still holds (see NStepAccumulator)
+        self.compressed_bytes = 0
+        self.cache = OrderedDict()    # chunk id -> decoded (chunk_size, *frame_shape) array
+        self._last_next = None        # Last next_state pushed and its frame number
+        self._lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self._pending = None
+
+    # --- Frame stream -----------------------------------------------------
+    def _add_frame(self, obs):
+        frame = pack_observation(obs)
+        if self.frame_shape is None:
+            self.frame_shape, self.frame_dtype = frame.shape, frame.dtype
+        self.open_chunk.append(frame)
+        index = self.frame_count
+        self.frame_count += 1
+        if len(self.open_chunk) == self.chunk_size:
+            self._seal_chunk()
+        return index
+
+    def _words(self, frames):
+        """Frames as rows of the widest unsigned ints dividing a frame's byte size (faster XOR)."""
+        rows = frames.reshape(len(frames), -1).view(np.uint8)
+        for word in (np.uint64, np.uint32, np.uint16):
+            if rows.shape[1] % np.dtype(word).itemsize == 0:
+                return rows.view(word)
+        return rows
+
+    def _seal_chunk(self):
+        raw = self._words(np.stack(self.open_chunk))
+        delta = raw.copy()
+        delta[1:] ^= raw[:-1]
+        chunk_id = (self.frame_count - 1) // self.chunk_size
+        data = self.compress(delta.tobytes())
+        self.chunks[chunk_id] = data
+        self.compressed_bytes += len(data)
+        self.open_chunk = []
+
+    def _decode_chunk(self, data):
+        delta = np.frombuffer(self.decompress(data), dtype=np.uint8).reshape(self.chunk_size, -1)
+        raw = np.bitwise_xor.accumulate(self._words(delta), axis=0)
+        return raw.view(np.uint8).view(self.frame_dtype).reshape((self.chunk_size,) + self.frame_shape)
+
+    def _drop_old_chunks(self):
+        first_live = self._live_min[0][0]
+        if self._keep_from is not None:
+            first_live = min(first_live, self._keep_from)
+        first_live //= self.chunk_size
+        while self.oldest_chunk < first_live:
+            # Decoded copies in the cache are left to age out (the prefetch thread may be using them)
+            data = self.chunks.pop(self.oldest_chunk, None)
+            if data is not None:
+                self.compressed_bytes -= len(data)
+            self.oldest_chunk += 1
+
+    # --- Buffer interface -------------------------------------------------
+    def push(self, state, action, reward, next_state, done, game_state=None, discount=None):
+        with self._lock:
+            last = self._last_next
+            if last is not None and (state is last[0] or np.array_equal(state, last[0])):
+                s = last[1]
+            else:
+                s = self._add_frame(state)
+            n = self._add_frame(next_state)
+            self._last_next = (next_state, n)
+            self._store(s, action, reward, n, done, game_state, discount)
+
+    def add_frame(self, obs):
+        """Append an observation to the frame stream. Returns its frame number for push_frames."""
+        with self._lock:
+            return self._add_frame(obs)
+
+    def push_frames(self, state_frame, action, reward, next_frame, done, game_state=None, discount=None,
+                    keep_from=None):
+        """
+        push() with states given as frame numbers from add_frame, so shared frames are stored once.
+
+        keep_from: oldest frame number the caller may still push; older frames that no
+            stored transition uses are dropped.
+        """
+        with self._lock:
+            self._keep_from = keep_from
+            self._store(state_frame, action, reward, next_frame, done, game_state, discount)
+
+    def _store(self, s, action, reward, n, done, game_state, discount):
+        # Caller holds the lock
+        i = self.position
+        self.state_idx[i] = s
+        self.next_idx[i] = n
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.discounts[i] = np.nan if discount is None else discount
+        if self.size == self.capacity:
+            self.evicted += 1
+        self.game_states.append(game_state)
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        push = self._pushes
+        self._pushes += 1
+        frame = min(s, n)
+        while self._live_min and self._live_min[-1][0] >= frame:
+            self._live_min.pop()
+        self._live_min.append((frame, push))
+        while self._live_min[0][1] <= push - self.capacity:
+            self._live_min.popleft()
+        if self.size == self.capacity:
+            self._drop_old_chunks()
+
+    def _frames(self, indices, chunks, open_frames, open_start):
+        """Decode the given frame numbers using the chunk snapshot taken under the lock."""
+        out = np.empty((len(indices),) + self.frame_shape, dtype=self.frame_dtype)
+        chunk_ids = indices // self.chunk_size
+        for chunk_id in np.unique(chunk_ids):
+            rows = chunk_ids == chunk_id
+            if chunk_id in chunks:
+                decoded = self.cache.get(chunk_id)
+                if decoded is None:
+                    self.cache_misses += 1
+                    decoded = self._decode_chunk(chunks[chunk_id])
+                    self.cache[chunk_id] = decoded
+                    if len(self.cache) > self.cache_chunks:
+                        self.cache.popitem(last=False)
+                else:
+                    self.cache_hits += 1
+                    self.cache.move_to_end(chunk_id)
+                out[rows] = decoded[indices[rows] % self.chunk_size]
+            else:
+                out[rows] = open_frames[indices[rows] - open_start]
+        return unpack_observation(out)
+
+    def _sample_now(self, batch_size):
+        start = time.perf_counter()
+        with self._lock:
+            picks = np.random.randint(0, self.size, size=batch_size)
+            s, n = self.state_idx[picks], self.next_idx[picks]
+            actions, rewards, dones = self.actions[picks], self.rewards[picks], self.dones[picks]
+            discounts = self.discounts[picks]
+            # Snapshot what decoding needs so pushes can continue meanwhile
+            chunks = {c: self.chunks[c] for c in np.unique(np.concatenate([s, n]) // self.chunk_size)
+                      if c in self.chunks}
+            open_start = self.frame_count - len(self.open_chunk)
+            open_frames = np.stack(self.open_chunk) if self.open_chunk else None
+        indices = np.concatenate([s, n])
+        frames = self._frames(indices, chunks, open_frames, open_start)
+        self.samples += batch_size
+        self.sample_seconds += time.perf_counter() - start
+        return frames[:batch_size], actions, rewards, frames[batch_size:], dones, discounts
+
+    def sample(self, batch_size):
+        if self._executor is None:
+            return self._sample_now(batch_size)
+        # The prefetched batch was drawn during the previous call, one push behind
+        pending, self._pending = self._pending, None
+        batch = pending.result() if pending is not None else None
+        if batch is None or len(batch[1]) != batch_size:
+            batch = self._sample_now(batch_size)
+        self._pending = self._executor.submit(self._sample_now, batch_size)
+        return batch
+
+    def set_rewards(self, rewards, start=0):
+        """Replace the rewards of the stored transitions from the start-th oldest on (oldest first)."""
+        with self._lock:
+            oldest = self.position if self.size == self.capacity else 0
+            order = (oldest + np.arange(start, self.size)) % self.capacity
+            self.rewards[order] = np.asarray(rewards, dtype=np.float32)
+        # A prefetched batch may carry the old rewards
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def stores_n_step(self):
+        return not np.isnan(self.discounts[:self.size]).all()
+
+    def stats(self):
+        """Compression ratio and sample throughput so far."""
+        frame_bytes = int(np.prod(self.frame_shape)) * np.dtype(self.frame_dtype).itemsize if self.frame_shape else 0
+        stored_frames = len(self.chunks) * self.chunk_size + len(self.open_chunk)
+        raw_bytes = stored_frames * frame_bytes
+        stored_bytes = self.compressed_bytes + len(self.open_chunk) * frame_bytes
+        return {
+            "transitions": self.size,
+            "frames": stored_frames,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 0.0,
+            "bytes_per_transition": stored_bytes / self.size if self.size else 0.0,
+            "samples_per_sec": self.samples / self.sample_seconds if self.sample_seconds else 0.0,
+            "cache_hit_rate": self.cache_hits / max(1, self.cache_hits + self.cache_misses),
+        }
+
+    def memory_bytes(self):
+        """Live bytes of ring arrays, compressed chunks, the open chunk, decoded cache and game states."""
+        ring = sum(a.nbytes for a in (self.state_idx, self.next_idx, self.actions, self.rewards, self.dones,
+                                      self.discounts))
+        frames = sum(f.nbytes for f in self.open_chunk) + sum(c.nbytes for c in list(self.cache.values()))
+        seen = set()
+        return (ring + self.compressed_bytes + frames
+                + deep_nbytes(self.game_states, seen) + deep_nbytes(self.start_states, seen))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __len__(self):
+        return self.size
+
+
+NO_FRAME = np.iinfo(np.int64).max
+
+
+class NStepAccumulator:
+    """
+    Turns per-step transitions into n-step transitions on their way into a buffer.
+
+    Each environment has a rolling window of its last n steps in preallocated
+    arrays. Once the window is full, its oldest step is pushed with the
+    discounted return of the window, the latest next_state and discount gamma^n.
+    When an episode terminates (done) or is cut off (end_episode), the remaining
+    steps are pushed with their shorter returns and matching gamma^k.
+    With n_step=1 transitions go straight to the buffer unchanged.
+
+    For buffers with a frame stream (CompressedReplayBuffer) each observation is
+    added once when it first arrives and the window keeps its frame number, so
+    s_t is not stored again when its transition is emitted n-1 steps later.
+    """
+
+    def __init__(self, buffer, n_step=3, gamma=0.99, num_envs=1):
+        self.buffer = buffer
+        self.n_step = n_step
+        self.gamma = gamma
+        self.powers = gamma ** np.arange(n_step + 1)
+        self.states = np.empty((num_envs, n_step), dtype=object)
+        self.use_frames = hasattr(buffer, "add_frame")
+        # State frame numbers of the pending steps and of each env's last next_state (use_frames);
+        # NO_FRAME marks empty entries so the minimum is the oldest frame still held
+        self.frame_ids = np.full((num_envs, n_step), NO_FRAME, dtype=np.int64)
+        self.next_ids = np.full(num_envs, NO_FRAME, dtype=np.int64)
+        self.next_states = [None] * num_envs
+        self.game_states = np.empty((num_envs, n_step), dtype=object)
+        self.actions = np.zeros((num_envs, n_step), dtype=np.int64)
+        self.rewards = np.zeros((num_envs, n_step), dtype=np.float64)
+        self.start = np.zeros(num_envs, dtype=np.int64)   # Window slot of the oldest pending step
+        self.count = np.zeros(num_envs, dtype=np.int64)
+
+    def push(self, state, action, reward, next_state, done, game_state=None, env=0):
+        if self.n_step == 1:
+            self.buffer.push(state, action, reward, next_state, done, game_state)
+            return
+        slot = (self.start[env] + self.count[env]) % self.n_step
+        if self.use_frames:
+            self.frame_ids[env, slot] = self._frame(env, state)
+            self.next_ids[env] = self.buffer.add_frame(next_state)
+            self.next_states[env] = next_state
+        else:
+            self.states[env, slot] = state
+        self.game_states[env, slot] = game_state
+        self.actions[env, slot] = action
+        self.rewards[env, slot] = reward
+        self.count[env] += 1
+        if done:
+            self._flush(env, next_state, True)
+        elif self.count[env] == self.n_step:
+            self._emit(env, next_state, False)
+
+    def end_episode(self, next_state, env=0):
+        """Push the steps still pending after an episode was cut off without done (bootstrapped)."""
+        self._flush(env, next_state, False)
+
+    def _frame(self, env, obs):
+        """Frame number of obs: the env's last next_state if obs is that observation, else a new frame."""
+        last = self.next_states[env]
+        if last is not None and (obs is last or np.array_equal(obs, last)):
+            return self.next_ids[env]
+        self.next_states[env] = obs
+        self.next_ids[env] = self.buffer.add_frame(obs)
+        return self.next_ids[env]
+
+    def _emit(self, env, next_state, done):
+        k = self.count[env]
+        first = self.start[env]
+        window = (first + np.arange(k)) % self.n_step
+        ret = float(self.rewards[env, window] @ self.powers[:k])
+        if self.use_frames:
+            next_frame = self._frame(env, next_state)
+            state_frame = self.frame_ids[env, first]
+            self.frame_ids[env, first] = NO_FRAME
+            keep_from = min(self.frame_ids.min(), self.next_ids.min())
+            self.buffer.push_frames(state_frame, self.actions[env, first], ret, next_frame, done,
+                                    self.game_states[env, first], discount=float(self.powers[k]),
+                                    keep_from=None if keep_from == NO_FRAME else int(keep_from))
+        else:
+            self.buffer.push(self.states[env, first], self.actions[env, first], ret, next_state, done,
+                             self.game_states[env, first], discount=float(self.powers[k]))
+        self.states[env, first] = self.game_states[env, first] = None
+        self.start[env] = (first + 1) % self.n_step
+        self.count[env] -= 1
+
+    def _flush(self, env, next_state, done):
+        while self.count[env]:
+            self._emit(env, next_state, done)
+        self.start[env] = 0
+        # The next episode starts from a new observation; stop holding the last one
+        self.next_states[env] = None
+        self.next_ids[env] = NO_FRAME
+
+
+def make_replay_buffer(capacity, storage="raw", codec="zlib"):
+    """ReplayBuffer for storage="raw", CompressedReplayBuffer for storage="compressed"."""
+    if storage == "compressed":
+        return CompressedReplayBuffer(capacity, codec=codec)
+    if storage == "raw":
+        return ReplayBuffer(capacity)
+    raise ValueError(f"unknown replay storage '{storage}'")
+
+
+def check_frame_stream(num_envs=4, capacity=500, chunk_size=16, n_step=3, steps=3000, done_prob=0.02, seed=0):
+    """
+    Feed random lockstep envs through NStepAccumulator into a ReplayBuffer and a
+    CompressedReplayBuffer side by side, wrapping both many times, and compare
+    every stored transition after each round. Returns the number of mismatches
+    (rows whose frames were dropped or decode differently).
+    """
+    rng = np.random.default_rng(seed)
+    raw = ReplayBuffer(capacity)
+    packed = CompressedReplayBuffer(capacity, chunk_size=chunk_size, prefetch=False)
+    accumulators = [NStepAccumulator(raw, n_step, 0.9, num_envs), NStepAccumulator(packed, n_step, 0.9, num_envs)]
+    states = [rng.random(8).astype(np.float32) for _ in range(num_envs)]
+    mismatches = 0
+    for _ in range(steps):
+        for env in range(num_envs):
+            next_state = rng.random(8).astype(np.float32)
+            done = rng.random() < done_prob
+            for accumulator in accumulators:
+                accumulator.push(states[env], 0, 1.0, next_state, done, env=env)
+            states[env] = rng.random(8).astype(np.float32) if done else next_state
+        if not len(packed):
+            continue
+        rows = (packed.position - packed.size + np.arange(packed.size)) % capacity
+        open_frames = np.stack(packed.open_chunk) if packed.open_chunk else None
+        open_start = packed.frame_count - len(packed.open_chunk)
+        try:
+            frames = packed._frames(np.concatenate([packed.state_idx[rows], packed.next_idx[rows]]),
+                                    packed.chunks, open_frames, open_start)
+        except (IndexError, TypeError):
+            mismatches += 1
+            continue
+        expected = np.array([t[0] for t in raw.buffer] + [t[3] for t in raw.buffer])
+        mismatches += int((frames != expected).any(axis=1).sum())
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from environments import SimEnv
+
+    parser = argparse.ArgumentParser(description="Compare raw and compressed replay storage on simulated frames")
+    parser.add_argument("--transitions", type=int, default=20000)
+    parser.add_argument("--codec", choices=sorted(_CODECS), default="zlib")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batches", type=int, default=500)
+    parser.add_argument("--check", action="store_true",
+                        help="check multi-env n-step frame sharing across wrap-around instead")
+    args = parser.parse_args()
+
+    if args.check:
+        failed = 0
+        for num_envs, capacity, chunk_size in ((1, 500, 16), (4, 500, 16), (4, 4, 2), (8, 64, 4)):
+            mismatches = check_frame_stream(num_envs, capacity, chunk_size)
+            failed += mismatches
+            print(f"{'❌' if mismatches else '✅'} {num_envs} envs, capacity {capacity}, chunk {chunk_size}: "
+                  f"{mismatches} mismatching transitions")
+        raise SystemExit(1 if failed else 0)
+
+    env = SimEnv("screen", seed=0)
+    raw = ReplayBuffer(args.transitions)
+    packed = CompressedReplayBuffer(args.transitions, codec=args.codec)
+    state = env.reset()
+    for _ in range(args.transitions):
+        action = random.choice((4, 8, 9))
+        next_state, _, done = env.step(action)
+        raw.push(state, action, 0.0, next_state, done)
+        packed.push(state, action, 0.0, next_state, done)
+        state = env.reset() if done else next_state
+
+    # Raw storage holds the float frames it is given; count each distinct array once
+    raw_bytes = sum(arr.nbytes for arr in {id(a): a for t in raw.buffer for a in (t[0], t[3])}.values())
+    for name, buffer in (("raw", raw), ("compressed", packed)):
+        start = time.perf_counter()
+        for _ in range(args.batches):
+            buffer.sample(args.batch_size)
+        rate = args.batches * args.batch_size / (time.perf_counter() - start)
+        print(f"⏱️ {name:10s} {rate:10.0f} samples/s")
+    stats = packed.stats()
+    print(f"📦 {stats['transitions']} transitions: raw {raw_bytes / 2**20:.1f} MiB, compressed "
+          f"{stats['stored_bytes'] / 2**20:.1f} MiB ({stats['compression_ratio']:.1f}x over uint8 frames, "
+          f"{stats['bytes_per_transition']:.0f} bytes/transition, {raw_bytes / stats['stored_bytes']:.1f}x over raw)")
+    packed.close()
@@ -0,0 +1,261 @@
+"""
+Offline reward relabeling.
+
+Recomputes rewards and their breakdown for whole stored episodes at once with
+NumPy, following the same rules as RewardTracker.calculate_reward. Used to try
+new reward constants on recorded data instead of collecting new episodes:
+
+    python reward_relabel.py logs/session --set movement_per_pixel=1.0
+"""
+
+import numpy as np
+
+from reward_tracker import DEFAULT_REWARD_PARAMS, milestone_bonus
+
+
+# Raw game_state fields consumed by RewardTracker.calculate_reward
+GAME_STATE_FIELDS = ('x', 'score', 'lives', 'flagpole', 'world', 'level', 'time_remaining')
+
+# Values RewardTracker.calculate_reward uses for missing keys
+_FIELD_DEFAULTS = {'x': 0, 'score': 0, 'lives': 3, 'flagpole': False,
+                   'world': 0, 'level': 0, 'time_remaining': 400}
+
+BREAKDOWN_KEYS = ('movement', 'points', 'progress', 'death', 'time', 'flagpole',
+                  'stagnation', 'velocity_bonus', 'milestone', 'level_progression', 'time_out')
+
+
+def states_to_arrays(game_states):
+    """
+    Convert a sequence of game_state dicts into a dict of field arrays.
+
+    Each dict must also carry an 'episode' key; consecutive steps with the same
+    episode value form one episode.
+    """
+    arrays = {'episode': np.array([gs['episode'] for gs in game_states], dtype=np.int64)}
+    for field in GAME_STATE_FIELDS:
+        default = _FIELD_DEFAULTS[field]
+        dtype = bool if field == 'flagpole' else np.int64
+        arrays[field] = np.array([gs.get(field, default) for gs in game_states], dtype=dtype)
+    return arrays
+
+
+def _segments(episode):
+    """Return (segment index per step, start index per segment)."""
+    new_episode = np.ones(len(episode), dtype=bool)
+    new_episode[1:] = episode[1:] != episode[:-1]
+    starts = np.flatnonzero(new_episode)
+    return np.cumsum(new_episode) - 1, starts
+
+
+def _previous(values, starts, seg, initial):
+    """values shifted by one step within each episode; initial[seg] at episode starts."""
+    prev = np.empty_like(values)
+    prev[1:] = values[:-1]
+    prev[starts] = initial
+    return prev
+
+
+def _segment_cumsum(values, starts, seg):
+    cs = np.cumsum(values)
+    base = (cs - values)[starts]
+    return cs - base[seg]
+
+
+def _segment_cummax(values, starts, seg, initial):
+    """Running max within each episode, including initial[seg]."""
+    values = np.maximum(values.astype(np.float64), initial[seg])
+    # Lift each episode above all earlier ones so the accumulate never carries across episodes
+    offset = seg * (values.max() - values.min() + 1.0)
+    return np.maximum.accumulate(values + offset) - offset
+
+
+def relabel(arrays, params=None, start_states=None):
+    """
+    Recompute rewards for stored steps.
+
+    Args:
+        arrays: Dict from states_to_arrays (or equivalent arrays, in step order)
+        params: Optional dict overriding entries of DEFAULT_REWARD_PARAMS
+        start_states: Optional {episode: game_state} for episodes that began
+            mid-level (see RewardTracker.reset_episode)
+
+    Returns:
+        tuple: (total_reward array, breakdown dict of arrays keyed like calculate_reward)
+    """
+    p = dict(DEFAULT_REWARD_PARAMS, **(params or {}))
+    episode = np.asarray(arrays['episode'])
+    x = np.asarray(arrays['x'], dtype=np.float64)
+    score = np.asarray(arrays['score'], dtype=np.float64)
+    lives = np.asarray(arrays['lives'], dtype=np.float64)
+    flag = np.asarray(arrays['flagpole'], dtype=bool)
+    world = np.asarray(arrays['world'], dtype=np.int64)
+    level = np.asarray(arrays['level'], dtype=np.int64)
+    time_left = np.asarray(arrays['time_remaining'], dtype=np.float64)
+    n = len(episode)
+    if n == 0:
+        return np.zeros(0), {key: np.zeros(0) for key in BREAKDOWN_KEYS}
+
+    seg, starts = _segments(episode)
+    pos = np.arange(n) - starts[seg]
+
+    # Per-episode initial tracker state (RewardTracker.reset_episode)
+    start_states = start_states or {}
+    def initial(field, default):
+        return np.array([start_states.get(ep, {}).get(field, default) for ep in episode[starts]],
+                        dtype=np.float64)
+    init_x = initial('x', 0)
+    init_score = initial('score', 0)
+    init_lives = initial('lives', 3)
+    init_world = initial('world', 0).astype(np.int64)
+    init_level = initial('level', 0).astype(np.int64)
+    init_time = initial('time_remaining', 400)
+
+    prev_x = _previous(x, starts, seg, init_x)
+
+    # Points
+    prev_score = _previous(score, starts, seg, init_score)
+    points = np.maximum(0.0, score - prev_score) * p['points_per_score']
+
+    # Stagnation: backward movement, no progress over the window, capped per episode
+    window = p['stagnation_window']
+    window_full = pos + 1 >= window
+    window_start = np.where(window_full, np.arange(n) - (window - 1), 0)
+    stuck = window_full & (x - x[window_start] < p['stagnation_threshold'])
+    raw_stagnation = (np.where((prev_x > 0) & (x < prev_x), p['backward_penalty'], 0.0)
+                      + np.where(stuck, p['stagnation_penalty'], 0.0))
+    capped = np.maximum(_segment_cumsum(raw_stagnation, starts, seg), p['stagnation_cap'])
+    stagnation = capped - _previous(capped, starts, seg, np.zeros(len(starts)))
+
+    # Movement, velocity and unstuck bonus (was_stuck comes from the previous step)
+    delta_x = np.maximum(0.0, x - prev_x)
+    movement = delta_x * p['movement_per_pixel']
+    was_stuck = _previous(stuck, starts, seg, np.zeros(len(starts), dtype=bool))
+    velocity_bonus = (np.where(delta_x > p['velocity_threshold'], p['velocity_bonus'], 0.0)
+                      + np.where(was_stuck & (delta_x > p['unstuck_threshold']), p['unstuck_bonus'], 0.0))
+
+    # New max X and milestones; both follow the running max of X within the episode
+    running_max = _segment_cummax(x, starts, seg, init_x)
+    prev_max = _previous(running_max, starts, seg, init_x)
+    progress = np.where(x > prev_max, p['progress_bonus'], 0.0)
+
+    milestones = np.arange(p['milestone_start'], p['milestone_end'], p['milestone_step'])
+    cumulative = np.concatenate([[0.0], np.cumsum([milestone_bonus(m, p) for m in milestones])])
+    reached = lambda m: cumulative[np.searchsorted(milestones, m, side='right')]
+    milestone = reached(running_max) - reached(prev_max)
+
+    # Death: prev_lives only moves down
+    lives_low = -_segment_cummax(-lives, starts, seg, -init_lives)
+    prev_lives = _previous(lives_low, starts, seg, init_lives)
+    death = np.where(lives < prev_lives, p['death_penalty'], 0.0)
+    time_penalty = np.full(n, p['time_penalty'])
+
+    # Flagpole
+    flag_seen = _segment_cumsum(flag.astype(np.int64), starts, seg) > 0
+    triggered_before = _previous(flag_seen, starts, seg, np.zeros(len(starts), dtype=bool))
+    flagpole = (np.where((x > p['flagpole_zone_x']) & ~triggered_before, p['flagpole_zone_bonus'], 0.0)
+                + np.where(flag & ~triggered_before, p['flagpole_bonus'], 0.0))
+
+    # Level progression (prev_x has already been updated to the current X at this point)
+    prev_world = _previous(world, starts, seg, init_world)
+    prev_level = _previous(level, starts, seg, init_level)
+    changed = (world != prev_world) | (level != prev_level)
+    started = (prev_world != 0) | (prev_level != 0) | (x > 0)
+    level_progression = np.where(changed & started, p['level_bonus'], 0.0)
+
+    # Time out
+    prev_time = _previous(time_left, starts, seg, init_time)
+    time_out = np.where((time_left == 0) & (prev_time > 0), p['time_out_penalty'], 0.0)
+
+    breakdown = {
+        'movement': movement,
+        'points': points,
+        'progress': progress,
+        'death': death,
+        'time': time_penalty,
+        'flagpole': flagpole,
+        'stagnation': stagnation,
+        'velocity_bonus': velocity_bonus,
+        'milestone': milestone,
+        'level_progression': level_progression,
+        'time_out': time_out
+    }
+    total = np.sum([breakdown[key] for key in BREAKDOWN_KEYS], axis=0)
+    return total, breakdown
+
+
+def summarize_episodes(episode, breakdown):
+    """Per-episode totals of each breakdown component (like get_episode_summary)."""
+    seg, starts = _segments(np.asarray(episode))
+    summary = {}
+    for i, ep in enumerate(np.asarray(episode)[starts]):
+        summary[int(ep)] = {key: float(values[seg == i].sum()) for key, values in breakdown.items()}
+    return summary
+
+
+def relabel_buffer(buffer, params=None, start_states=None):
+    """
+    Recompute and overwrite the rewards stored in a ReplayBuffer.
+
+    Episodes that began mid-level use the start states recorded with
+    buffer.set_episode_start; start_states adds to or overrides them.
+    Once the buffer has evicted transitions, its oldest episode has lost its first
+    steps and the tracker state they built up (max X, stagnation window), so that
+    episode keeps the rewards it was stored with and only the following ones are
+    relabeled.
+
+    Returns:
+        (rewards, breakdown) for the relabeled transitions, i.e. the newest len(rewards)
+    """
+    if any(gs is None for gs in buffer.game_states):
+        raise ValueError("every transition needs a game_state to be relabeled")
+    if buffer.stores_n_step():
+        raise ValueError("n-step returns cannot be relabeled per step; relabel the trace or trajectories instead")
+    arrays = states_to_arrays(buffer.game_states)
+    skip = 0
+    if buffer.evicted:
+        episode = arrays['episode']
+        later = np.flatnonzero(episode != episode[0])
+        skip = int(later[0]) if len(later) else len(episode)
+        arrays = {field: values[skip:] for field, values in arrays.items()}
+    starts = dict(buffer.start_states)
+    starts.update(start_states or {})
+    rewards, breakdown = relabel(arrays, params, starts)
+    buffer.set_rewards(rewards, start=skip)
+    return rewards, breakdown
+
+
+def relabel_trace(path, params=None):
+    """Recompute rewards for the steps of a session trace. Returns (arrays, rewards, breakdown)."""
+    from session_trace import load_trace
+
+    trace = load_trace(path)
+    game_states = [payload for kind, payload in trace['annotations'] if kind == 'game_state']
+    start_states = {payload['episode']: payload for kind, payload in trace['annotations']
+                    if kind == 'episode_start'}
+    arrays = states_to_arrays(game_states)
+    rewards, breakdown = relabel(arrays, params, start_states)
+    return arrays, rewards, breakdown
+
+
+if __name__ == "__main__":
+    import argparse
+    import ast
+
+    parser = argparse.ArgumentParser(description="Relabel the rewards of a recorded session trace")
+    parser.add_argument("trace", help="trace directory written by train.py --record")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a DEFAULT_REWARD_PARAMS entry (repeatable)")
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        if name not in DEFAULT_REWARD_PARAMS:
+            parser.error(f"unknown reward parameter '{name}'")
+        overrides[name] = ast.literal_eval(value)
+
+    arrays, rewards, breakdown = relabel_trace(args.trace, overrides)
+    for episode, summary in summarize_episodes(arrays['episode'], breakdown).items():
+        total = sum(summary.values())
+        print(f"Episode {episode} - Reward: {total:.2f} - " +
+              " ".join(f"{key}:{value:.2f}" for key, value in summary.items() if value))
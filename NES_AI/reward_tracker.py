@@ -4,6 +4,45 @@ Centralizes reward calculation and state tracking across frames.
 """
 
 
+# Reward constants. Override any of them with RewardTracker(params={...});
+# reward_relabel.py recomputes stored rewards from the same table.
+DEFAULT_REWARD_PARAMS = {
+    # Positive rewards (10x multiplier)
+    'points_per_score': 2.5,          # Per point of score gained
+    'movement_per_pixel': 0.5,        # Per pixel of forward movement
+    'velocity_threshold': 20,         # Pixels per step for the velocity bonus
+    'velocity_bonus': 5.0,
+    'unstuck_threshold': 10,          # Pixels per step to count as moving after being stuck
+    'unstuck_bonus': 20.0,
+    'progress_bonus': 50.0,           # New max X
+    'milestone_start': 500,           # Milestones every milestone_step pixels in [start, end)
+    'milestone_end': 3250,
+    'milestone_step': 50,
+    'milestone_tiers': ((1000, 20.0), (1600, 50.0), (2500, 80.0), (float('inf'), 150.0)),
+    'flagpole_zone_x': 3000,          # Close-to-flagpole bonus beyond this X
+    'flagpole_zone_bonus': 50.0,
+    'flagpole_bonus': 10000.0,
+    'level_bonus': 5000.0,
+    # Penalties (20x multiplier)
+    'death_penalty': -50.0,
+    'time_penalty': -0.005,
+    'backward_penalty': -10.0,
+    'stagnation_window': 30,          # Frames of X history checked for stagnation
+    'stagnation_threshold': 10,       # Min pixels to move within the window
+    'stagnation_penalty': -10.0,
+    'stagnation_cap': -1000.0,        # Max total stagnation penalty per episode
+    'time_out_penalty': -2000.0,
+}
+
+
+def milestone_bonus(x, params=DEFAULT_REWARD_PARAMS):
+    """Bonus for the milestone at X position x (progressive tiers toward the flagpole)."""
+    for limit, bonus in params['milestone_tiers']:
+        if x < limit:
+            return bonus
+    return 0.0
+
+
 class RewardTracker:
     """
     Tracks game state across frames and calculates rewards for the RL agent.
@@ -16,8 +55,15 @@ class RewardTracker:
     - Flagpole completion rewards
     """
     
-    def __init__(self):
-        """Initialize reward tracker with state tracking variables."""
+    def __init__(self, params=None):
+        """
+        Initialize reward tracker with state tracking variables.
+        
+        Args:
+            params: Optional dict overriding entries of DEFAULT_REWARD_PARAMS
+        """
+        self.params = dict(DEFAULT_REWARD_PARAMS, **(params or {}))
+        
         # Previous state tracking
         self.prev_x = 0
         self.max_x = 0
@@ -29,7 +75,7 @@ class RewardTracker:
         
         # Stagnation tracking
         self.x_history = []  # Last 30 X positions
-        self.stagnation_threshold = 10  # Min pixels to move in 30 frames
+        self.stagnation_threshold = self.params['stagnation_threshold']  # Min pixels to move in 30 frames
         self.was_stuck = False  # Track if agent was stuck last check
         
         # Milestone tracking
@@ -57,8 +103,16 @@ class RewardTracker:
             'time_out': 0.0
         }
     
-    def reset_episode(self):
-        """Reset tracking for new episode."""
+    def reset_episode(self, start_state=None):
+        """
+        Reset tracking for new episode.
+        
+        Args:
+            start_state: Optional game_state dict (same keys as calculate_reward) for
+                episodes that begin mid-level, e.g. from a curriculum savestate. The
+                tracker starts from that position so the first step is not rewarded
+                for the distance already covered.
+        """
         self.prev_x = 0
         self.max_x = 0
         self.prev_lives = 3
@@ -93,6 +147,22 @@ class RewardTracker:
             'level_progression': 0.0,
             'time_out': 0.0
         }
+        
+        if start_state is not None:
+            start_x = start_state.get('x', 0)
+            self.prev_x = start_x
+            self.max_x = start_x
+            self.prev_lives = start_state.get('lives', 3)
+            self.prev_score = start_state.get('score', 0)
+            self.prev_world = start_state.get('world', 0)
+            self.prev_level = start_state.get('level', 0)
+            self.prev_time = start_state.get('time_remaining', 400)
+            self.milestones_reached = {x for x in self._milestones() if start_x >= x}
+    
+    def _milestones(self):
+        """X positions of all milestones."""
+        p = self.params
+        return range(p['milestone_start'], p['milestone_end'], p['milestone_step'])
     
     def _calculate_points_reward(self, curr_score):
         """
@@ -101,34 +171,35 @@ class RewardTracker:
         Points × 2.5 = reward (100 points = +250.0, 500 points = +1250.0) - 10x INCREASE
         """
         score_gained = max(0, curr_score - self.prev_score)
-        reward = score_gained * 2.5  # 10x INCREASE from 0.25
+        reward = score_gained * self.params['points_per_score']  # 10x INCREASE from 0.25
         self.prev_score = curr_score
         return reward
     
     def _calculate_movement_reward(self, curr_x):
         """Calculate enhanced movement rewards with velocity and milestones - 10x INCREASE."""
+        p = self.params
         # Continuous movement reward - 10x INCREASE
         delta_x = max(0, curr_x - self.prev_x)
-        movement_reward = delta_x * 0.5  # 10x INCREASE from 0.05
+        movement_reward = delta_x * p['movement_per_pixel']  # 10x INCREASE from 0.05
         
         # Velocity bonus for fast movement - 10x INCREASE
         velocity_bonus = 0.0
-        if delta_x > 20:
-            velocity_bonus = 5.0  # 10x INCREASE from 0.5
+        if delta_x > p['velocity_threshold']:
+            velocity_bonus = p['velocity_bonus']  # 10x INCREASE from 0.5
         
         # "Unstuck" bonus - reward agent for moving after being stuck - 10x INCREASE
-        if self.was_stuck and delta_x > 10:
-            velocity_bonus += 20.0  # 10x INCREASE from 2.0
+        if self.was_stuck and delta_x > p['unstuck_threshold']:
+            velocity_bonus += p['unstuck_bonus']  # 10x INCREASE from 2.0
         
         # Update stuck status for next frame
-        if len(self.x_history) >= 30:
+        if len(self.x_history) >= p['stagnation_window']:
             x_progress = curr_x - self.x_history[0]
             self.was_stuck = (x_progress < self.stagnation_threshold)
         
         # New max X bonus - 10x INCREASE
         progress_reward = 0.0
         if curr_x > self.max_x:
-            progress_reward = 50.0  # 10x INCREASE from 5.0
+            progress_reward = p['progress_bonus']  # 10x INCREASE from 5.0
             self.max_x = curr_x
         
         # Milestone bonuses (trigger once per episode) - 10x INCREASE
@@ -137,19 +208,10 @@ class RewardTracker:
         
         # Generate milestones every 50 pixels from 500 to 3200 (flagpole)
         # Reward increases as agent gets closer to flagpole
-        for x in range(500, 3250, 50):
+        for x in self._milestones():
             if curr_x >= x and x not in self.milestones_reached:
-                # Progressive rewards: more reward as you get closer to flagpole - 10x INCREASE
-                if x < 1000:
-                    bonus = 20.0      # 10x INCREASE from 2.0
-                elif x < 1600:
-                    bonus = 50.0      # 10x INCREASE from 5.0
-                elif x < 2500:
-                    bonus = 80.0      # 10x INCREASE from 8.0
-                else:
-                    bonus = 150.0     # 10x INCREASE from 15.0
-                
-                milestone_reward += bonus
+                # Progressive rewards: 20 / 50 / 80 / 150 below 1000 / 1600 / 2500 / flagpole - 10x INCREASE
+                milestone_reward += milestone_bonus(x, p)
                 self.milestones_reached.add(x)
         
         self.prev_x = curr_x
@@ -158,11 +220,11 @@ class RewardTracker:
     def _calculate_penalties(self, curr_lives):
         """Calculate penalties for death and time."""
         death_penalty = 0.0
-        time_penalty = -0.005
+        time_penalty = self.params['time_penalty']
         
         # Death penalty
         if curr_lives < self.prev_lives:
-            death_penalty = -50.0
+            death_penalty = self.params['death_penalty']
             self.prev_lives = curr_lives
         
         return death_penalty, time_penalty
@@ -182,31 +244,32 @@ class RewardTracker:
         Returns:
             float: Stagnation penalty (negative value or 0.0)
         """
+        p = self.params
         stagnation_penalty = 0.0
         
         # Add current X to history
         self.x_history.append(curr_x)
         
         # Keep only last 30 frames
-        if len(self.x_history) > 30:
+        if len(self.x_history) > p['stagnation_window']:
             self.x_history.pop(0)
         
         # Check for backward movement (immediate penalty) - BRUTAL 20x INCREASE
         if self.prev_x > 0 and curr_x < self.prev_x:
-            stagnation_penalty -= 10.0  # 20x INCREASE from original -0.5
+            stagnation_penalty += p['backward_penalty']  # 20x INCREASE from original -0.5
         
         # Check for stagnation (after 30 frames) - BRUTAL 20x INCREASE
-        if len(self.x_history) >= 30:
+        if len(self.x_history) >= p['stagnation_window']:
             x_progress = curr_x - self.x_history[0]
             if x_progress < self.stagnation_threshold:
-                stagnation_penalty -= 10.0  # 20x INCREASE from original -0.5
+                stagnation_penalty += p['stagnation_penalty']  # 20x INCREASE from original -0.5
         
         # Cap stagnation penalty to prevent catastrophic failures
         # Check if adding this penalty would exceed the cap
         potential_total = self.episode_rewards['stagnation'] + stagnation_penalty
-        if potential_total < -1000.0:  # 20x INCREASE from original -50.0
+        if potential_total < p['stagnation_cap']:  # 20x INCREASE from original -50.0
             # Only apply penalty up to the cap
-            stagnation_penalty = -1000.0 - self.episode_rewards['stagnation']
+            stagnation_penalty = p['stagnation_cap'] - self.episode_rewards['stagnation']
         
         return stagnation_penalty
     
@@ -225,16 +288,17 @@ class RewardTracker:
         Returns:
             float: Flagpole reward
         """
+        p = self.params
         flagpole_reward = 0.0
         
         # Close to flagpole bonus - 10x INCREASE
-        if curr_x > 3000 and not self.flagpole_triggered:
-            flagpole_reward += 50.0  # 10x INCREASE from 5.0
+        if curr_x > p['flagpole_zone_x'] and not self.flagpole_triggered:
+            flagpole_reward += p['flagpole_zone_bonus']  # 10x INCREASE from 5.0
         
         # MASSIVE flagpole completion reward - 10x INCREASE
         if flagpole_flag and not self.flagpole_triggered:
             self.flagpole_triggered = True
-            flagpole_reward += 10000.0  # 10x INCREASE from 1000.0
+            flagpole_reward += p['flagpole_bonus']  # 10x INCREASE from 1000.0
         
         return flagpole_reward
     
@@ -258,7 +322,7 @@ class RewardTracker:
         if (curr_world != self.prev_world or curr_level != self.prev_level):
             # Only award if we've actually started (not just initialization)
             if self.prev_world != 0 or self.prev_level != 0 or self.prev_x > 0:
-                level_reward = 5000.0  # 10x INCREASE from 500.0
+                level_reward = self.params['level_bonus']  # 10x INCREASE from 500.0
         
         # Update tracking
         self.prev_world = curr_world
@@ -283,7 +347,7 @@ class RewardTracker:
         
         # BRUTAL time-out penalty - agent should NEVER let time run out
         if curr_time == 0 and self.prev_time > 0:
-            time_out_penalty = -2000.0  # 20x INCREASE from original -100.0
+            time_out_penalty = self.params['time_out_penalty']  # 20x INCREASE from original -100.0
         
         # Update tracking
         self.prev_time = curr_time
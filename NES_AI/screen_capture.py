@@ -1,17 +1,55 @@
 # screen_capture.py
-import pygetwindow as gw
-import pyautogui
 import numpy as np
-from PIL import Image
 from time import sleep
 from config import WINDOW_TITLE
 
+# Trace hooks (see session_trace.py): a source replaces window capture entirely,
+# an observer sees every captured frame.
+_trace_source = None
+_trace_observer = None
+
+
+def set_trace_hooks(source=None, observer=None):
+    global _trace_source, _trace_observer
+    _trace_source = source
+    _trace_observer = observer
+
+
+def pack_observation(obs):
+    """Compact storage form of an observation: screen frames as uint8 (exact, frames are uint8 / 255), RAM as float32."""
+    obs = np.asarray(obs)
+    if obs.ndim == 2:
+        return np.rint(obs * 255).astype(np.uint8)
+    return obs.astype(np.float32)
+
+
+def unpack_observation(packed, dtype=np.float32):
+    """Inverse of pack_observation (works on stacked observations too)."""
+    if packed.dtype == np.uint8:
+        return packed.astype(dtype) / 255.0
+    return packed
+
 
 def get_frame():
+    """Return the next 84x84 grayscale frame in [0, 1] (captured, or replayed from a trace)."""
+    if _trace_source is not None:
+        return _trace_source()
+    frame = _capture_frame()
+    if _trace_observer is not None:
+        _trace_observer(frame)
+    return frame
+
+
+def _capture_frame():
     """Capture a grayscale downsampled 84x84 frame from the emulator window using Pillow.
 
     Waits for window to be focused before capturing.
     """
+    # Window capture is Windows-only; imported here so trace replay works on any OS
+    import pygetwindow as gw
+    import pyautogui
+    from PIL import Image
+
     while True:
         try:
             win = gw.getWindowsWithTitle(WINDOW_TITLE)[0]
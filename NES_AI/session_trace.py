@@ -0,0 +1,297 @@
+# session_trace.py
+# Record-and-replay of live sessions for deterministic offline performance testing
+#
+# A trace holds every bridge state read through memory_interface, every frame
+# returned by screen_capture.get_frame, every bridge command id and the number of
+# polls each command acknowledgement wait made, each with the time (seconds since
+# recording started) at which it was seen. The training loop
+# also annotates each step's game_state (used by reward_relabel.py). Replaying feeds
+# them back in the same order, so train.main takes the same code path as in the
+# live session without the emulator, the window or the keyboard.
+#
+# A trace is a directory of chunk files (trace_000000.npz, ...) written while
+# recording, so memory stays bounded and a crash loses at most the last chunk.
+# Single-file traces from earlier versions still load.
+#
+#     python train.py --record logs/session          # live session, recorded
+#     python session_trace.py logs/session           # benchmark train.main on it
+#     python session_trace.py logs/session --realtime
+
+import glob
+import json
+import os
+import time
+import numpy as np
+
+import bridge_commands
+import emulator_controller
+import memory_interface as mem
+import screen_capture
+from memory_budget import deep_nbytes
+
+
+class TraceExhausted(Exception):
+    """Raised when replay code asks for more events than the trace holds."""
+
+
+class TraceRecorder:
+    """
+    Records a session into the trace directory path.
+
+    Events are buffered and written out as a chunk file whenever chunk_states
+    bridge states or chunk_frames frames have been collected, and by save().
+    """
+
+    def __init__(self, path, chunk_states=20000, chunk_frames=1000):
+        self.path = path
+        self.chunk_states = chunk_states
+        self.chunk_frames = chunk_frames
+        self.chunk_index = 0
+        self.totals = {"states": 0, "frames": 0, "commands": 0}
+        self.start = time.perf_counter()
+        self._reset_chunk()
+        os.makedirs(path, exist_ok=True)
+        for stale in list_trace_chunks(path):
+            os.remove(stale)
+
+    def _reset_chunk(self):
+        self.mem_times, self.mem_states = [], []
+        self.frame_times, self.frames = [], []
+        self.cmd_times, self.cmd_ids = [], []
+        self.wait_times, self.wait_polls = [], []
+        self.annotations = []
+
+    def _now(self):
+        return time.perf_counter() - self.start
+
+    def on_memory(self, state):
+        self.mem_times.append(self._now())
+        self.mem_states.append(json.dumps(state, separators=(",", ":")))
+        if len(self.mem_states) >= self.chunk_states:
+            self.flush()
+
+    def on_frame(self, frame):
+        self.frame_times.append(self._now())
+        self.frames.append(screen_capture.pack_observation(frame))
+        if len(self.frames) >= self.chunk_frames:
+            self.flush()
+
+    def on_command(self, cmd_id):
+        self.cmd_times.append(self._now())
+        self.cmd_ids.append(cmd_id)
+
+    def on_wait(self, polls):
+        self.wait_times.append(self._now())
+        self.wait_polls.append(polls)
+
+    def annotate(self, kind, payload):
+        """Store a (kind, JSON-serializable payload) note; not replayed."""
+        self.annotations.append([kind, payload])
+
+    def memory_bytes(self):
+        """Live bytes of the events buffered for the next chunk."""
+        seen = set()
+        return sum(deep_nbytes(items, seen) for items in
+                   (self.mem_times, self.mem_states, self.frame_times, self.frames,
+                    self.cmd_times, self.cmd_ids, self.wait_times, self.wait_polls, self.annotations))
+
+    def install(self):
+        mem.set_trace_hooks(observer=self.on_memory)
+        screen_capture.set_trace_hooks(observer=self.on_frame)
+        bridge_commands.set_trace_hooks(observer=self.on_command, wait_observer=self.on_wait)
+        return self
+
+    def uninstall(self):
+        mem.set_trace_hooks()
+        screen_capture.set_trace_hooks()
+        bridge_commands.set_trace_hooks()
+
+    def flush(self):
+        """Write the buffered events as the next chunk file."""
+        if not (self.mem_states or self.frames or self.cmd_ids or self.wait_polls or self.annotations):
+            return
+        frames = np.stack(self.frames) if self.frames else np.zeros((0, 84, 84), dtype=np.uint8)
+        # States are stored as one newline-separated JSON blob to keep the file compact
+        states = "\n".join(self.mem_states).encode("utf-8")
+        path = os.path.join(self.path, f"trace_{self.chunk_index:06d}.npz")
+        # Written under a temporary name so a crash never leaves a truncated chunk behind
+        tmp_path = path[:-len(".npz")] + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            mem_times=np.asarray(self.mem_times, dtype=np.float64),
+            mem_states=np.frombuffer(states, dtype=np.uint8),
+            frame_times=np.asarray(self.frame_times, dtype=np.float64),
+            frames=frames,
+            cmd_times=np.asarray(self.cmd_times, dtype=np.float64),
+            cmd_ids=np.asarray(self.cmd_ids, dtype=np.int64),
+            wait_times=np.asarray(self.wait_times, dtype=np.float64),
+            wait_polls=np.asarray(self.wait_polls, dtype=np.int64),
+            annotations=np.frombuffer(json.dumps(self.annotations).encode("utf-8"), dtype=np.uint8),
+        )
+        os.replace(tmp_path, path)
+        self.totals["states"] += len(self.mem_states)
+        self.totals["frames"] += len(self.frames)
+        self.totals["commands"] += len(self.cmd_ids)
+        self.chunk_index += 1
+        self._reset_chunk()
+
+    def save(self):
+        self.flush()
+        print(f"💾 Trace saved to {self.path} ({self.totals['states']} states, "
+              f"{self.totals['frames']} frames, {self.totals['commands']} commands "
+              f"in {self.chunk_index} chunks)")
+
+
+def list_trace_chunks(path):
+    """Chunk files of the trace directory path, in recording order."""
+    return sorted(glob.glob(os.path.join(path, "trace_[0-9]*[0-9].npz")))
+
+
+def _load_chunk(path):
+    with np.load(path) as data:
+        blob = data["mem_states"].tobytes().decode("utf-8")
+        return {
+            "mem_times": data["mem_times"],
+            "mem_states": [json.loads(s) for s in blob.split("\n")] if blob else [],
+            "frame_times": data["frame_times"],
+            "frames": data["frames"],
+            "cmd_times": data["cmd_times"],
+            "cmd_ids": data["cmd_ids"].tolist(),
+            # Traces recorded before poll counts were kept replay waits on the wall clock
+            "wait_times": data["wait_times"] if "wait_times" in data else None,
+            "wait_polls": data["wait_polls"].tolist() if "wait_polls" in data else None,
+            "annotations": (json.loads(data["annotations"].tobytes().decode("utf-8"))
+                            if "annotations" in data else []),
+        }
+
+
+def load_trace(path):
+    """Load a trace directory (or single-file trace) into a dict of event lists and timestamp arrays."""
+    if os.path.isfile(path):
+        return _load_chunk(path)
+    chunks = [_load_chunk(p) for p in list_trace_chunks(path)]
+    if not chunks:
+        raise FileNotFoundError(f"no trace chunks in {path}")
+    trace = {}
+    for key in ("mem_times", "frame_times", "frames", "cmd_times"):
+        trace[key] = np.concatenate([c[key] for c in chunks])
+    for key in ("mem_states", "cmd_ids", "annotations"):
+        trace[key] = [event for c in chunks for event in c[key]]
+    has_waits = all(c["wait_polls"] is not None for c in chunks)
+    trace["wait_times"] = np.concatenate([c["wait_times"] for c in chunks]) if has_waits else None
+    trace["wait_polls"] = [event for c in chunks for event in c["wait_polls"]] if has_waits else None
+    return trace
+
+
+class _Channel:
+    """One recorded event stream, consumed in order."""
+
+    def __init__(self, name, times, events, replayer):
+        self.name = name
+        self.times = times
+        self.events = events
+        self.replayer = replayer
+        self.position = 0
+
+    def next(self):
+        if self.position >= len(self.events):
+            raise TraceExhausted(f"trace has no more '{self.name}' events ({self.position} replayed)")
+        self.replayer.wait_until(self.times[self.position])
+        event = self.events[self.position]
+        self.position += 1
+        return event
+
+
+class TraceReplayer:
+    """Feeds a recorded trace back through memory_interface, screen_capture and bridge_commands.
+
+    With realtime=False events are returned as fast as the code asks for them;
+    with realtime=True each event is held back until its recorded time.
+    """
+
+    def __init__(self, trace, realtime=False):
+        if isinstance(trace, str):
+            trace = load_trace(trace)
+        self.realtime = realtime
+        self.start = None
+        self.mem = _Channel("memory", trace["mem_times"], trace["mem_states"], self)
+        self.frames = _Channel("frame", trace["frame_times"], trace["frames"], self)
+        self.commands = _Channel("command", trace["cmd_times"], trace["cmd_ids"], self)
+        self.waits = (_Channel("ack wait", trace["wait_times"], trace["wait_polls"], self)
+                      if trace.get("wait_polls") is not None else None)
+
+    def wait_until(self, t):
+        if not self.realtime:
+            return
+        if self.start is None:
+            self.start = time.perf_counter() - t
+        delay = self.start + t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_memory(self):
+        # Callers may mutate the dict they get; hand out a copy
+        return dict(self.mem.next())
+
+    def next_frame(self):
+        # Same float64 frames as window capture
+        return screen_capture.unpack_observation(self.frames.next(), np.float64)
+
+    def sleep(self, seconds):
+        """Replacement for time.sleep in replayed code: recorded times already include waits."""
+
+    def consumed(self):
+        return {"memory": self.mem.position, "frame": self.frames.position, "command": self.commands.position}
+
+    def install(self):
+        mem.set_trace_hooks(source=self.next_memory)
+        screen_capture.set_trace_hooks(source=self.next_frame)
+        bridge_commands.set_trace_hooks(source=self.commands.next,
+                                        wait_source=self.waits.next if self.waits is not None else None)
+        emulator_controller.set_input_sink(lambda action: None)
+        return self
+
+    def uninstall(self):
+        mem.set_trace_hooks()
+        screen_capture.set_trace_hooks()
+        bridge_commands.set_trace_hooks()
+        emulator_controller.set_input_sink()
+
+
+def benchmark(path, realtime=False, output_dir=None):
+    """
+    Run train.main against a recorded trace until it runs out. Returns a stats dict.
+
+    Nothing is written unless output_dir is given (see train.main).
+    """
+    import train
+
+    replayer = TraceReplayer(path, realtime=realtime)
+    start = time.perf_counter()
+    try:
+        train.main(replay=replayer, output_dir=output_dir)
+    except TraceExhausted:
+        pass
+    elapsed = time.perf_counter() - start
+    consumed = replayer.consumed()
+    stats = {
+        "elapsed": elapsed,
+        "frames": consumed["frame"],
+        "states": consumed["memory"],
+        "frames_per_sec": consumed["frame"] / elapsed if elapsed > 0 else 0.0,
+        "states_per_sec": consumed["memory"] / elapsed if elapsed > 0 else 0.0,
+    }
+    print(f"⏱️ Replayed {stats['frames']} frames / {stats['states']} states in {elapsed:.2f}s "
+          f"({stats['frames_per_sec']:.1f} frames/s, {stats['states_per_sec']:.1f} states/s)")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark train.main against a recorded session trace")
+    parser.add_argument("trace", help="trace directory written by train.py --record")
+    parser.add_argument("--realtime", action="store_true", help="replay at the recorded speed")
+    parser.add_argument("--output", metavar="DIR", help="write the run's logs, checkpoints and trajectories here")
+    args = parser.parse_args()
+    benchmark(args.trace, realtime=args.realtime, output_dir=args.output)
@@ -0,0 +1,282 @@
+# sweep.py
+# Parallel hyperparameter sweep over the simulated environment
+#
+# Each trial trains a fresh agent on environments.SimEnv in its own process with
+# a fixed number of PyTorch threads, so cores x 1 thread runs as many trials side
+# by side as the machine has cores. Trials stream one row per episode into a
+# shared results table (logs/sweep_results.csv) and are stopped early when their
+# recent max X falls below the median of the other trials at the same episode.
+#
+#     python sweep.py --trials 16 --workers 8
+#     python sweep.py --grid --space my_space.json
+#
+# Trials are compared on max X, not reward: the reward constants are part of the
+# search space, so rewards from different trials are on different scales.
+
+import csv
+import itertools
+import json
+import os
+import queue
+import random
+import time
+import numpy as np
+
+from config import ACTIONS, EPISODES, MAX_STEPS, N_STEP, REPLAY_CODEC, REPLAY_STORAGE
+from reward_tracker import DEFAULT_REWARD_PARAMS
+
+# Parameters consumed by the trial itself; every other key must name a reward constant
+TRIAL_DEFAULTS = {
+    "lr": 1e-4,
+    "gamma": 0.99,
+    "epsilon_decay": 0.999993,
+    "buffer_capacity": 10000,
+    "episodes": EPISODES,
+    "max_steps": MAX_STEPS,
+    "backbone": None,        # None = default for the observation mode (see agent.BACKBONES)
+    "dueling": False,
+    "n_step": N_STEP,
+}
+
+# Values are lists (grid points / random choice) or {"uniform": [lo, hi]} / {"log_uniform": [lo, hi]}
+DEFAULT_SEARCH_SPACE = {
+    "lr": {"log_uniform": [3e-5, 1e-3]},
+    "gamma": [0.95, 0.99],
+    "epsilon_decay": [0.999, 0.9995, 0.9998],
+    "buffer_capacity": [5000, 20000],
+    "episodes": [60],
+    "max_steps": [MAX_STEPS],
+    "movement_per_pixel": [0.5, 1.0],
+    "stagnation_penalty": [-10.0, -2.0],
+}
+
+RESULT_FIELDS = ("trial", "episode", "max_x", "total_reward", "steps", "epsilon", "flagpole", "elapsed", "status")
+
+
+def grid_trials(space):
+    """Every combination of the listed values."""
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"grid search needs a list of values for '{name}'")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(space[n] for n in names))]
+
+
+def random_trials(space, count, seed=None):
+    """count independent samples from the space."""
+    rng = random.Random(seed)
+
+    def sample(values):
+        if isinstance(values, list):
+            return rng.choice(values)
+        if "uniform" in values:
+            return rng.uniform(*values["uniform"])
+        if "log_uniform" in values:
+            lo, hi = np.log(values["log_uniform"])
+            return float(np.exp(rng.uniform(lo, hi)))
+        raise ValueError(f"unknown distribution {values}")
+
+    return [{name: sample(values) for name, values in space.items()} for _ in range(count)]
+
+
+def split_params(params):
+    """Split a trial's parameters into (trial settings, reward constant overrides)."""
+    trial = dict(TRIAL_DEFAULTS)
+    reward_params = {}
+    for name, value in params.items():
+        if name in TRIAL_DEFAULTS:
+            trial[name] = value
+        elif name in DEFAULT_REWARD_PARAMS:
+            reward_params[name] = value
+        else:
+            raise ValueError(f"unknown sweep parameter '{name}'")
+    return trial, reward_params
+
+
+class MedianStopper:
+    """
+    Median stopping rule over a shared board of {episode: [scores]}.
+
+    A trial stops when, after grace episodes, its score at a checkpoint is below
+    the median of at least min_trials other trials at that checkpoint.
+    """
+
+    def __init__(self, board, lock, grace=20, every=10, min_trials=3):
+        self.board = board
+        self.lock = lock
+        self.grace = grace
+        self.every = every
+        self.min_trials = min_trials
+
+    def should_stop(self, episode, score):
+        if episode < self.grace or (episode + 1) % self.every:
+            return False
+        with self.lock:
+            others = self.board.get(episode, [])
+            self.board[episode] = others + [score]
+        return len(others) >= self.min_trials and score < float(np.median(others))
+
+
+def _init_worker(threads):
+    # Fixed per-process thread budget so parallel trials do not oversubscribe the cores
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+
+
+def run_trial(trial_id, params, results, stopper=None, observation_mode="ram", seed=0, window=10):
+    """
+    Train a fresh agent on SimEnv with one parameter set.
+
+    Args:
+        results: queue receiving one RESULT_FIELDS dict per episode
+        stopper: optional MedianStopper for early termination
+        window: episodes averaged for the score
+
+    Returns:
+        dict: trial id, params, status, episodes run, score (mean max X of the last window episodes)
+    """
+    import torch
+    from agent import Agent
+    from environments import SimEnv
+    from replay_buffer import NStepAccumulator, make_replay_buffer
+    from reward_tracker import RewardTracker
+
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    settings, reward_params = split_params(params)
+    env = SimEnv(observation_mode, seed=seed)
+    agent = Agent(observation_mode, lr=settings["lr"], gamma=settings["gamma"],
+                  epsilon_decay=settings["epsilon_decay"], backbone=settings["backbone"],
+                  dueling=settings["dueling"])
+    memory = make_replay_buffer(int(settings["buffer_capacity"]), REPLAY_STORAGE, REPLAY_CODEC)
+    n_step = NStepAccumulator(memory, int(settings["n_step"]), agent.gamma)
+    reward_tracker = RewardTracker(reward_params)
+    available_actions = [a for a in ACTIONS if a != "START"]
+
+    start = time.perf_counter()
+    max_xs = []
+    status = "completed"
+    for episode in range(int(settings["episodes"])):
+        state = env.reset()
+        reward_tracker.reset_episode(env.start_state)
+        total_reward = 0.0
+        steps = 0
+        for step in range(int(settings["max_steps"])):
+            action_idx = agent.select_action(state, available_actions)
+            next_state, game_state, done = env.step(action_idx)
+            reward, _ = reward_tracker.calculate_reward(game_state)
+            n_step.push(state, action_idx, reward, next_state, done)
+            agent.train_step(memory)
+            state = next_state
+            total_reward += reward
+            steps += 1
+            if done:
+                break
+        n_step.end_episode(state)
+        agent.update_target()
+
+        max_xs.append(reward_tracker.max_x)
+        score = float(np.mean(max_xs[-window:]))
+        stop = stopper is not None and stopper.should_stop(episode, score)
+        if stop:
+            status = "stopped"
+        results.put({
+            "trial": trial_id, "episode": episode, "max_x": reward_tracker.max_x,
+            "total_reward": round(total_reward, 2), "steps": steps, "epsilon": round(agent.epsilon, 4),
+            "flagpole": reward_tracker.flagpole_triggered,
+            "elapsed": round(time.perf_counter() - start, 2), "status": status if stop else "running",
+        })
+        if stop:
+            break
+
+    return {"trial": trial_id, "params": params, "status": status, "episodes": len(max_xs),
+            "score": float(np.mean(max_xs[-window:])) if max_xs else 0.0,
+            "best_max_x": max(max_xs) if max_xs else 0, "elapsed": time.perf_counter() - start}
+
+
+def run_sweep(trials, workers=None, threads_per_trial=1, results_path="logs/sweep_results.csv",
+              early_stop=True, grace=20, every=10, min_trials=3, observation_mode="ram", seed=0):
+    """
+    Run trials in a process pool, writing each episode row to results_path as it arrives.
+
+    Returns:
+        list of run_trial summaries, best score first
+    """
+    from multiprocessing import Manager, Pool
+
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_trial)
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    print(f"🔍 Sweeping {len(trials)} trials on {workers} workers x {threads_per_trial} threads")
+
+    summaries = []
+    with Manager() as manager, open(results_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        results = manager.Queue()
+        stopper = MedianStopper(manager.dict(), manager.Lock(), grace, every, min_trials) if early_stop else None
+
+        with Pool(workers, initializer=_init_worker, initargs=(threads_per_trial,)) as pool:
+            pending = [pool.apply_async(run_trial, (i, params, results, stopper, observation_mode, seed + i))
+                       for i, params in enumerate(trials)]
+            while pending or not results.empty():
+                try:
+                    row = results.get(timeout=0.5)
+                except queue.Empty:
+                    row = None
+                if row is not None:
+                    writer.writerow(row)
+                    f.flush()
+                for task in [t for t in pending if t.ready()]:
+                    pending.remove(task)
+                    summary = task.get()
+                    summaries.append(summary)
+                    print(f"{'⏹️' if summary['status'] == 'stopped' else '✅'} Trial {summary['trial']} "
+                          f"{summary['status']} after {summary['episodes']} episodes - "
+                          f"score {summary['score']:.0f} ({summary['elapsed']:.1f}s)")
+
+    summaries.sort(key=lambda s: s["score"], reverse=True)
+    return summaries
+
+
+def print_leaderboard(summaries, top=5):
+    print("\n🏆 Best trials (mean max X over the last episodes):")
+    for s in summaries[:top]:
+        print(f"   Trial {s['trial']:3d} - score {s['score']:7.1f} - best X {s['best_max_x']:5d} - "
+              f"{s['status']} - {json.dumps(s['params'])}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep on the simulated environment")
+    parser.add_argument("--space", metavar="JSON", help="search space file (default: DEFAULT_SEARCH_SPACE)")
+    parser.add_argument("--grid", action="store_true", help="try every combination instead of random samples")
+    parser.add_argument("--trials", type=int, default=16, help="number of random trials")
+    parser.add_argument("--workers", type=int, help="parallel trials (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="PyTorch threads per trial")
+    parser.add_argument("--observation-mode", choices=("ram", "screen"), default="ram")
+    parser.add_argument("--no-early-stop", action="store_true")
+    parser.add_argument("--grace", type=int, default=20, help="episodes before a trial can be stopped")
+    parser.add_argument("--results", default="logs/sweep_results.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    space = DEFAULT_SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    trials = grid_trials(space) if args.grid else random_trials(space, args.trials, args.seed)
+    for params in trials:
+        split_params(params)  # Fail on unknown names before starting any process
+
+    summaries = run_sweep(trials, args.workers, args.threads, args.results,
+                          early_stop=not args.no_early_stop, grace=args.grace,
+                          observation_mode=args.observation_mode, seed=args.seed)
+    print_leaderboard(summaries)
+    with open(os.path.splitext(args.results)[0] + "_summary.json", "w") as f:
+        json.dump(summaries, f, indent=2)
@@ -2,15 +2,24 @@ import sys
 import time
 import os
 import numpy as np
-import imageio
-from config import EPISODES, MAX_STEPS, ACTIONS
+import random
+from config import EPISODES, MAX_STEPS, ACTIONS, OBSERVATION_MODE, RESET_MODE, SAVESTATE_SLOTS, RESET_TIMEOUT
+from config import SAVE_TRAJECTORIES, TRAJECTORY_DIR, TRAJECTORY_CHUNK_SIZE
+from config import REPLAY_STORAGE, REPLAY_CAPACITY, REPLAY_CODEC, N_STEP
+from config import MEMORY_BUDGET_MB, MEMORY_REPORT_EVERY, TRACEMALLOC_SNAPSHOTS
 from emulator_controller import launch_game, send_input
 from screen_capture import get_frame
-from replay_buffer import ReplayBuffer
-from agent import Agent
+from replay_buffer import NStepAccumulator, make_replay_buffer
 from reward_tracker import RewardTracker
+from ram_observation import get_observation
+from bridge_commands import load_savestate
+from trajectory_dataset import TrajectoryWriter, new_run_id
+from memory_budget import MemoryMonitor, format_bytes, replay_capacity_for_budget
 import memory_interface as mem
 
+# Swapped for a no-op while replaying a trace (see session_trace.py)
+sleep = time.sleep
+
 
 class RewardLogger:
     """Logs reward breakdown to CSV file for analysis."""
@@ -56,7 +65,45 @@ class RewardLogger:
                    f"{breakdown['level_progression']:.2f},{breakdown['time_out']:.2f},"
                    f"{max_x},{epsilon:.3f},{success_rate:.2f}\n")
 
+def observe():
+    """Return the agent's observation for the configured OBSERVATION_MODE."""
+    if OBSERVATION_MODE == "ram":
+        return get_observation()
+    return get_frame()
+
+def read_game_state():
+    """Build the game_state dict consumed by RewardTracker.calculate_reward."""
+    curr_x, curr_y = mem.get_mario_position()
+    return {
+        'x': curr_x or 0,
+        'score': mem.get_score(),
+        'lives': mem.get_lives() or 3,
+        'flagpole': mem.is_flagpole_triggered(),
+        'world': mem.get_world(),
+        'level': mem.get_level(),
+        'time_remaining': mem.get_time_remaining()
+    }
+
+def reset_from_savestate():
+    """Reset by loading a savestate through the bridge command channel.
+
+    Returns the first observation, or None if the bridge did not acknowledge
+    (e.g. an older bridge.lua without the command channel) or did not land in play.
+    """
+    slot = random.choice(SAVESTATE_SLOTS)
+    state = load_savestate(slot, timeout=RESET_TIMEOUT)
+    if state is None or state.get("game_status") != "playing":
+        return None
+    print(f"⚡ Loaded savestate slot {slot} (frame {state.get('cmd_frame')})")
+    return observe()
+
 def reset_game():
+    if RESET_MODE == "savestate":
+        obs = reset_from_savestate()
+        if obs is not None:
+            return obs
+        print("⚠️ Savestate reset failed - falling back to title screen reset")
+
     print("🔄 Waiting to return to title screen...")
     
     # Wait for dying/game_over/transition to settle (with timeout)
@@ -64,12 +111,12 @@ def reset_game():
     settle_count = 0
     while mem.get_game_status() in ("game_over", "dying", "transition"):
         print(f"💀 Waiting to settle... ({mem.get_game_status()})")
-        time.sleep(0.5)
+        sleep(0.5)
         settle_count += 1
         if settle_count >= settle_timeout:
             print("⚠️ Settle timeout - forcing START press")
             send_input("START")
-            time.sleep(1)
+            sleep(1)
             break
 
     for i in range(120):
@@ -78,9 +125,9 @@ def reset_game():
 
         if status == "title":
             print("🟦 Title screen detected — pressing START.")
-            time.sleep(0.5)
+            sleep(0.5)
             send_input("START")
-            time.sleep(0.5)
+            sleep(0.5)
 
             for j in range(100):
                 current_status = mem.get_game_status()
@@ -88,69 +135,150 @@ def reset_game():
                 print(f"⏳ Waiting for gameplay... ({j}) status:{current_status} pos:({x},{y})")
                 if current_status == "playing" or (x and y and x > 0 and y > 0):
                     print("▶️ Game has started.")
-                    return get_frame()
-                time.sleep(0.1)
+                    return observe()
+                sleep(0.1)
 
             print("⚠️ START pressed, but not playing.")
             break
 
         elif status == "playing":
             print("✅ Already playing.")
-            return get_frame()
+            return observe()
         
         # Recovery: if stuck in unknown state, try pressing START
         elif status not in ("title", "playing", "game_over", "dying", "transition"):
             print(f"⚠️ Unknown state '{status}' - attempting START press")
             send_input("START")
-            time.sleep(1)
+            sleep(1)
 
-        time.sleep(0.1)
+        sleep(0.1)
 
     # Final fallback: press START multiple times to recover
     print("⚠️ Timeout waiting for title screen - attempting recovery")
     for attempt in range(3):
         print(f"🔧 Recovery attempt {attempt + 1}/3")
         send_input("START")
-        time.sleep(1)
+        sleep(1)
         if mem.get_game_status() == "playing":
             print("✅ Recovery successful!")
-            return get_frame()
+            return observe()
     
     print("❌ Recovery failed - returning current frame")
-    return get_frame()
+    return observe()
 
 def create_video_writer(episode, fps=60):
-    # Use imageio to write mp4s via ffmpeg
+    # Use imageio to write mp4s via ffmpeg (imported here: only screen mode records video)
+    import imageio
     os.makedirs("logs", exist_ok=True)
     return imageio.get_writer(f"logs/episode_{episode}.mp4", fps=fps)
 
-def main():
+def main(record=None, replay=None, output_dir=None):
+    """Run training.
+
+    Args:
+        record: Optional trace directory; the session is recorded to it (see session_trace.py).
+        replay: Optional session_trace.TraceReplayer (or trace path) to run against instead
+            of the live emulator. Stops with TraceExhausted when the trace runs out.
+            A replay starts from a fresh, seeded agent and writes nothing unless output_dir is given.
+        output_dir: Directory receiving the logs/, models/ and trajectory outputs of a replay
+            (same layout as a live run, no videos). Ignored for live sessions.
+    """
+    global sleep
     # Prevent running on Python versions that lack compatible prebuilt numpy/opencv wheels
     if sys.version_info.major == 3 and sys.version_info.minor >= 14:
         print("\n⚠️ Detected Python 3.14+. Prebuilt binary wheels for numpy/opencv may be unavailable on Windows.")
         print("Please install Python 3.11 or 3.12, create a virtual environment, and reinstall requirements.")
         print("See README.md for detailed steps.")
         return
-    os.makedirs("logs", exist_ok=True)
+    recorder = None
+    if replay is not None:
+        from session_trace import TraceReplayer
+        if isinstance(replay, str):
+            replay = TraceReplayer(replay)
+        replay.install()
+        sleep = replay.sleep
+    elif record is not None:
+        from session_trace import TraceRecorder
+        recorder = TraceRecorder(record).install()
+
+    try:
+        _train(live=replay is None, recorder=recorder, output_dir=output_dir)
+    finally:
+        if replay is not None:
+            replay.uninstall()
+            sleep = time.sleep
+        if recorder is not None:
+            recorder.uninstall()
+            recorder.save()
+
+def _train(live=True, recorder=None, output_dir=None):
+    # torch is imported with the agent, only once training actually starts
+    from agent import Agent
+
+    # A replay must not read or overwrite the live checkpoint and logs: it writes
+    # under output_dir (same layout) or nowhere, and starts from a seeded fresh agent
+    # so repeated benchmarks of one trace do the same work.
+    if live:
+        output_root = ""
+    else:
+        output_root = output_dir
+        import torch
+        random.seed(0)
+        np.random.seed(0)
+        torch.manual_seed(0)
+    writes = output_root is not None
+    log_dir = os.path.join(output_root, "logs") if writes else None
+    model_path = os.path.join(output_root, "models", "dqn_model.pth") if writes else None
+    if writes:
+        os.makedirs(log_dir, exist_ok=True)
+    # Episode numbers restart every run; chunks go to a per-run subdirectory
+    trajectory_dir = os.path.join(output_root, TRAJECTORY_DIR, new_run_id()) if writes else None
+
     agent = Agent()
-    memory = ReplayBuffer(10000)
+    capacity = REPLAY_CAPACITY
+    budget = MEMORY_BUDGET_MB * 2**20 if MEMORY_BUDGET_MB else None
+    if budget:
+        capacity = replay_capacity_for_budget(budget, OBSERVATION_MODE, REPLAY_STORAGE)
+        print(f"🧮 Replay capacity {capacity} fits the {format_bytes(budget)} memory budget")
+    memory = make_replay_buffer(capacity, REPLAY_STORAGE, REPLAY_CODEC)
+    n_step = NStepAccumulator(memory, N_STEP, agent.gamma)
     reward_tracker = RewardTracker()
-    reward_logger = RewardLogger()
-    agent.load_model()
-    launch_game()
-    print("\n" + "="*60)
-    print("⏳ Please load the Lua script (bridge.lua) in FCEUX now.")
-    print("   File → Lua → New Lua Script Window → Run bridge.lua")
-    print("="*60)
-    input("Press ENTER when the Lua script is loaded and running...")
-    print("✅ Starting training in 3 seconds...")
-    time.sleep(3)
+    reward_logger = RewardLogger(os.path.join(log_dir, "reward_breakdown.csv")) if writes else None
+    if live:
+        model_path = agent.resume(model_path)
+
+    trajectory = None
+    monitor = MemoryMonitor(budget, MEMORY_REPORT_EVERY, TRACEMALLOC_SNAPSHOTS,
+                            log_file=os.path.join(log_dir, "memory_log.csv") if writes else None)
+    monitor.register("replay", memory.memory_bytes)
+    monitor.register("model", agent.memory_bytes)
+    monitor.register("trajectory", lambda: trajectory.memory_bytes() if trajectory is not None else 0)
+    if recorder is not None:
+        monitor.register("trace", recorder.memory_bytes)
+    if live:
+        launch_game()
+        print("\n" + "="*60)
+        print("⏳ Please load the Lua script (bridge.lua) in FCEUX now.")
+        print("   File → Lua → New Lua Script Window → Run bridge.lua")
+        print("="*60)
+        input("Press ENTER when the Lua script is loaded and running...")
+        print("✅ Starting training in 3 seconds...")
+        sleep(3)
 
     for episode in range(EPISODES):
         state = reset_game()
-        reward_tracker.reset_episode()
+        # Savestates may start mid-level; keyboard resets always start at the level start
+        start_state = read_game_state() if RESET_MODE == "savestate" else None
+        reward_tracker.reset_episode(start_state)
+        if start_state is not None:
+            memory.set_episode_start(episode, start_state)
+            if recorder is not None:
+                recorder.annotate("episode_start", dict(start_state, episode=episode))
         available_actions = [a for a in ACTIONS if a != "START"]
-        video = create_video_writer(episode)
+        # Video is recorded from screen frames only; RAM mode never touches the window
+        video = create_video_writer(episode) if OBSERVATION_MODE == "screen" and live else None
+        trajectory = (TrajectoryWriter(episode, trajectory_dir, TRAJECTORY_CHUNK_SIZE, OBSERVATION_MODE)
+                      if SAVE_TRAJECTORIES and writes else None)
 
         total_reward = 0
         title_screen_count = 0
@@ -160,11 +288,12 @@ def main():
             mx, my = mem.get_mario_position()
             print(f"🎮 Episode {episode}, Step {step}: Status = {status} | Pos = ({mx}, {my})")
 
-            raw_frame = get_frame()
-            frame = (raw_frame * 255).astype(np.uint8)
-            # frame is grayscale 84x84; convert to RGB for writing
-            frame_rgb = np.stack([frame] * 3, axis=-1)
-            video.append_data(frame_rgb)
+            obs = observe()
+            if video is not None:
+                frame = (obs * 255).astype(np.uint8)
+                # frame is grayscale 84x84; convert to RGB for writing
+                frame_rgb = np.stack([frame] * 3, axis=-1)
+                video.append_data(frame_rgb)
 
             if status != "playing":
                 # If stuck on title screen during episode, press START twice (handles demo)
@@ -173,13 +302,13 @@ def main():
                     if title_screen_count >= 2:
                         print("🔧 Stuck on title screen - pressing START twice (demo prevention)")
                         send_input("START")
-                        time.sleep(0.3)
+                        sleep(0.3)
                         send_input("START")
-                        time.sleep(0.5)
+                        sleep(0.5)
                         title_screen_count = 0
                 
                 print("⏸️ Not in playing state.")
-                time.sleep(0.1)
+                sleep(0.1)
                 continue
             
             # Reset counter when playing
@@ -190,19 +319,10 @@ def main():
             print(f"🎮 Action: {chosen_action}")
             send_input(chosen_action)
 
-            next_state = raw_frame
+            next_state = obs
             
             # Build game_state dict from memory_interface calls
-            curr_x, curr_y = mem.get_mario_position()
-            game_state = {
-                'x': curr_x or 0,
-                'score': mem.get_score(),
-                'lives': mem.get_lives() or 3,
-                'flagpole': mem.is_flagpole_triggered(),
-                'world': mem.get_world(),
-                'level': mem.get_level(),
-                'time_remaining': mem.get_time_remaining()
-            }
+            game_state = read_game_state()
             
             # Calculate reward using RewardTracker
             reward, breakdown = reward_tracker.calculate_reward(game_state)
@@ -242,7 +362,13 @@ def main():
 
             done = mem.get_game_status() in ("game_over", "dying", "transition")
 
-            memory.push(state, action_idx, reward, next_state, done)
+            # Raw game_state is kept so rewards can be recomputed offline (reward_relabel.py)
+            step_state = dict(game_state, episode=episode)
+            n_step.push(state, action_idx, reward, next_state, done, step_state)
+            if trajectory is not None:
+                trajectory.append(state, action_idx, reward, next_state, done, step_state)
+            if recorder is not None:
+                recorder.annotate("game_state", step_state)
             agent.train_step(memory)
 
             state = next_state
@@ -252,21 +378,46 @@ def main():
                 print(f"⛔ Episode end — {mem.get_game_status()}")
                 break
 
-        video.close()
+        # Steps still in the n-step window when MAX_STEPS cut the episode short
+        n_step.end_episode(state)
+        # Measured before the trajectory flush so its buffered steps are counted
+        monitor.episode_end(episode)
+        if video is not None:
+            video.close()
+        if trajectory is not None:
+            trajectory.close()
         agent.update_target()
 
         # Get episode summary and log to CSV
         summary = reward_tracker.get_episode_summary()
         flagpole_reached = reward_tracker.flagpole_triggered
-        reward_logger.log_episode(episode, total_reward, summary, 
-                                  reward_tracker.max_x, agent.epsilon, flagpole_reached)
-
         print(f"✅ Episode {episode} - Total Reward: {total_reward:.2f} - Epsilon: {agent.epsilon:.3f}")
-        with open("logs/episode_log.txt", "a", encoding="utf-8") as f:
-            f.write(f"Episode {episode} - Reward: {total_reward:.2f} - Epsilon: {agent.epsilon:.3f}\n")
+        if writes:
+            reward_logger.log_episode(episode, total_reward, summary,
+                                      reward_tracker.max_x, agent.epsilon, flagpole_reached)
+            with open(os.path.join(log_dir, "episode_log.txt"), "a", encoding="utf-8") as f:
+                f.write(f"Episode {episode} - Reward: {total_reward:.2f} - Epsilon: {agent.epsilon:.3f}\n")
 
         if episode % 10 == 0:
-            agent.save_model()
+            if writes:
+                agent.save_model(model_path)
+            if REPLAY_STORAGE == "compressed":
+                stats = memory.stats()
+                print(f"📦 Replay: {stats['transitions']} transitions, {stats['stored_bytes'] / 2**20:.1f} MiB "
+                      f"({stats['compression_ratio']:.1f}x compression, {stats['samples_per_sec']:.0f} samples/s)")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the DQN agent")
+    parser.add_argument("--record", metavar="TRACE", help="record this session to a trace directory")
+    parser.add_argument("--replay", metavar="TRACE", help="run against a recorded trace instead of the emulator")
+    parser.add_argument("--realtime", action="store_true", help="replay at the recorded speed")
+    parser.add_argument("--output", metavar="DIR", help="with --replay: write logs, checkpoints and trajectories here")
+    args = parser.parse_args()
+
+    replay = None
+    if args.replay:
+        from session_trace import TraceReplayer
+        replay = TraceReplayer(args.replay, realtime=args.realtime)
+    main(record=args.record, replay=replay, output_dir=args.output)
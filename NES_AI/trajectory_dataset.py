@@ -0,0 +1,163 @@
+# trajectory_dataset.py
+# Per-episode trajectory files and a streaming loader for offline training
+#
+# Each training run writes into its own subdirectory (see new_run_id), and each
+# episode as one or more chunk files
+#     <directory>/<run id>/episode_000123_0000.npz
+# holding up to chunk_size consecutive steps:
+#     obs            (T, 84, 84) uint8 frames, or (T, N) float32 RAM observations
+#     next_obs_last  observation after the chunk's last step (next_obs[i] == obs[i + 1] otherwise)
+#     actions, rewards, dones
+#     episode, x, score, lives, flagpole, world, level, time_remaining (raw game_state)
+#     observation_mode  "screen" or "ram" (see chunk_observation_mode for older chunks)
+#
+# Chunks are read lazily, one at a time, so datasets larger than RAM can be streamed.
+
+import glob
+import os
+import random
+import time
+import numpy as np
+
+from config import OBSERVATION_MODE
+from memory_budget import deep_nbytes
+from reward_relabel import GAME_STATE_FIELDS
+from screen_capture import pack_observation, unpack_observation
+
+
+def new_run_id():
+    """Name of a training run's chunk subdirectory: start time plus pid, so runs never overwrite each other."""
+    return time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+
+
+class TrajectoryWriter:
+    """Buffers one episode's steps and writes them out in compressed chunks."""
+
+    def __init__(self, episode, directory="logs/trajectories", chunk_size=500, observation_mode=OBSERVATION_MODE):
+        self.episode = episode
+        self.observation_mode = observation_mode
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunk_index = 0
+        self._reset_chunk()
+        os.makedirs(directory, exist_ok=True)
+
+    def _reset_chunk(self):
+        self.obs, self.actions, self.rewards, self.dones = [], [], [], []
+        self.game_states = []
+        self.next_obs_last = None
+
+    def append(self, state, action, reward, next_state, done, game_state):
+        self.obs.append(pack_observation(state))
+        self.actions.append(action)
+        self.rewards.append(reward)
+        self.dones.append(done)
+        self.game_states.append(game_state)
+        self.next_obs_last = next_state
+        if len(self.obs) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.obs:
+            return
+        path = os.path.join(self.directory, f"episode_{self.episode:06d}_{self.chunk_index:04d}.npz")
+        fields = {f: np.array([gs[f] for gs in self.game_states]) for f in GAME_STATE_FIELDS}
+        np.savez_compressed(
+            path,
+            obs=np.stack(self.obs),
+            next_obs_last=pack_observation(self.next_obs_last),
+            actions=np.asarray(self.actions, dtype=np.int64),
+            rewards=np.asarray(self.rewards, dtype=np.float32),
+            dones=np.asarray(self.dones, dtype=bool),
+            episode=np.full(len(self.obs), self.episode, dtype=np.int64),
+            observation_mode=np.array(self.observation_mode),
+            **fields,
+        )
+        self.chunk_index += 1
+        self._reset_chunk()
+
+    def close(self):
+        self.flush()
+
+    def memory_bytes(self):
+        """Live bytes of the steps buffered for the next chunk."""
+        seen = set()
+        return sum(deep_nbytes(items, seen) for items in
+                   (self.obs, self.actions, self.rewards, self.dones, self.game_states, self.next_obs_last))
+
+
+def list_chunks(directory="logs/trajectories"):
+    """All chunk files under directory (any run subdirectory), in run/episode/chunk order."""
+    return sorted(glob.glob(os.path.join(directory, "**", "episode_*_*.npz"), recursive=True))
+
+
+def chunk_observation_mode(path):
+    """Observation mode a chunk was recorded in; chunks written before it was stored are told apart by dtype."""
+    with np.load(path) as data:
+        if "observation_mode" in data.files:
+            return str(data["observation_mode"])
+        return "screen" if data["obs"].dtype == np.uint8 else "ram"
+
+
+def load_chunk(path):
+    """Load one chunk as a dict of arrays, with observations decoded and next_obs rebuilt."""
+    with np.load(path) as data:
+        chunk = {key: data[key] for key in data.files}
+    obs = unpack_observation(chunk.pop("obs"))
+    next_last = unpack_observation(chunk.pop("next_obs_last"))
+    chunk["obs"] = obs
+    chunk["next_obs"] = np.concatenate([obs[1:], next_last[None]])
+    return chunk
+
+
+def iter_chunks(paths, workers=0, shuffle=False, seed=None):
+    """
+    Yield decoded chunks lazily.
+
+    With workers > 0, chunks are loaded and decompressed in a process pool
+    while the consumer works on the previous ones.
+    """
+    paths = list(paths)
+    if shuffle:
+        random.Random(seed).shuffle(paths)
+    if workers <= 0:
+        for path in paths:
+            yield load_chunk(path)
+        return
+
+    from multiprocessing import Pool
+    with Pool(workers) as pool:
+        for chunk in pool.imap(load_chunk, paths):
+            yield chunk
+
+
+def iter_batches(paths, batch_size=32, workers=0, shuffle_chunks=4, epochs=1, seed=None):
+    """
+    Yield (states, actions, rewards, next_states, dones) batches from chunk files.
+
+    Steps from up to shuffle_chunks chunks are pooled and shuffled before
+    batching, so batches mix episodes without loading the whole dataset.
+    Leftover steps that do not fill a batch are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    keys = ("obs", "actions", "rewards", "next_obs", "dones")
+    for epoch in range(epochs):
+        pending = []
+        chunks = iter_chunks(paths, workers=workers, shuffle=True,
+                             seed=None if seed is None else seed + epoch)
+        exhausted = False
+        while not exhausted:
+            while len(pending) < shuffle_chunks:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.append(chunk)
+            if not pending:
+                break
+            merged = {key: np.concatenate([c[key] for c in pending]) for key in keys}
+            pending = []
+            order = rng.permutation(len(merged["actions"]))
+            for start in range(0, len(order) - batch_size + 1, batch_size):
+                idx = order[start:start + batch_size]
+                yield tuple(merged[key][idx] for key in keys)